@@ -0,0 +1,64 @@
+"""
+Node construction throughput with and without validation
+
+Usage (from the package root, after ``./build.sh``)::
+
+    python3 -m benchmarks.construction
+"""
+
+from pathlib import Path
+from timeit import repeat
+
+import attrs
+
+from wast import parse, validation, w
+from wast.common import Node
+
+
+def collect_nodes(value, acc):
+    match value:
+        case Node():
+            acc.append(value)
+            for x in attrs.fields(value.__class__):
+                collect_nodes(getattr(value, x.name), acc)
+        case list() | tuple():
+            for x in value:
+                collect_nodes(x, acc)
+
+    return acc
+
+
+def mk_plan(tree):
+    """
+    Constructor calls recreating every node of the tree from its existing children
+    """
+    return [
+        (x.__class__, {f.name: getattr(x, f.name) for f in attrs.fields(x.__class__)})
+        for x in collect_nodes(tree, [])
+    ]
+
+
+def construct(plan):
+    for cls, kwargs in plan:
+        cls(**kwargs)
+
+
+def measure(plan, enabled, repeats):
+    with validation(enabled):
+        return min(repeat(lambda: construct(plan), number=1, repeat=repeats))
+
+
+def main(repeats=5):
+    plan = mk_plan(parse(Path(w.__file__).read_text()))
+
+    checked = measure(plan, True, repeats)
+    unchecked = measure(plan, False, repeats)
+
+    print(f"nodes per tree:     {len(plan)}")
+    print(f"validation on:      {len(plan) / checked:,.0f} nodes/s")
+    print(f"validation off:     {len(plan) / unchecked:,.0f} nodes/s")
+    print(f"speedup:            {checked / unchecked:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
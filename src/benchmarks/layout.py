@@ -0,0 +1,50 @@
+"""
+Formatting with ``unparse`` compared to the ``render.py`` + black flow,
+which formats ``unparse`` output with black
+
+Usage (from the package root, after ``./build.sh``)::
+
+    python3 -m benchmarks.layout
+"""
+
+from pathlib import Path
+from timeit import repeat
+
+from wast import parse, unparse, w
+
+try:
+    import black
+except ImportError:
+    black = None
+
+
+def measure(fn, repeats):
+    return min(repeat(fn, number=1, repeat=repeats))
+
+
+def main(repeats=5, line_length=88):
+    tree = parse(Path(w.__file__).read_text())
+
+    plain = measure(lambda: unparse(tree), repeats)
+    layout = measure(lambda: unparse(tree, line_length=line_length), repeats)
+
+    print(f"unparse:            {plain * 1000:,.1f} ms")
+    print(f"unparse + layout:   {layout * 1000:,.1f} ms")
+
+    if black is None:
+        print("black is not installed, skipping the comparison")
+        return
+
+    mode = black.Mode(line_length=line_length)
+    assert unparse(tree, line_length=line_length) == black.format_str(
+        unparse(tree), mode=mode
+    ), "the outputs differ"
+
+    formatted = measure(lambda: black.format_str(unparse(tree), mode=mode), repeats)
+
+    print(f"unparse + black:    {formatted * 1000:,.1f} ms")
+    print(f"speedup:            {formatted / layout:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
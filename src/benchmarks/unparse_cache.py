@@ -0,0 +1,55 @@
+"""
+Unparsing a regenerated tree with an ``UnparseCache`` warmed up by the tree
+it was regenerated from, compared to unparsing it without a cache
+
+Usage (from the package root, after ``./build.sh``)::
+
+    python3 -m benchmarks.unparse_cache
+"""
+
+from pathlib import Path
+from timeit import timeit
+
+from wast import UnparseCache, mk_transformer, parse, unparse, w
+
+
+def regenerate(tree):
+    """
+    The tree with the names in its middle statement renamed,
+    the other statements stay the same instances
+    """
+    middle = tree.body[len(tree.body) // 2]
+
+    @mk_transformer(
+        type=w.Name, filter=lambda node, ctx: any(x is middle for x in ctx.parents)
+    )
+    def rename(node, ctx):
+        return w.Name(id=f"{node.id}_")
+
+    return rename.transform(tree)
+
+
+def measure(fn, trees):
+    return min(timeit(lambda: fn(x), number=1) for x in trees)
+
+
+def main(repeats=5):
+    tree = parse(Path(w.__file__).read_text())
+    cache = UnparseCache()
+    unparse(tree, cache=cache)
+    # a new tree for every run, the cache has the statements of the original one
+    trees = [regenerate(tree) for _ in range(repeats)]
+    check = regenerate(tree)
+    assert unparse(check, cache=cache) == unparse(check), "the outputs differ"
+
+    plain = measure(unparse, trees)
+    cached = measure(lambda x: unparse(x, cache=cache), trees)
+
+    print(f"statements:         {len(tree.body):,}")
+    print(f"unparse:            {plain * 1000:,.1f} ms")
+    print(f"unparse + cache:    {cached * 1000:,.1f} ms")
+    print(f"speedup:            {plain / cached:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
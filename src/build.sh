@@ -16,6 +16,7 @@ time traceback-with-variables render.py
 
 cp template/* wast/
 
-black wast/
+# unparse output is formatted the way black formats it
+python3 -c 'from wast.layout import format_file; format_file("wast/nodes.py"); format_file("wast/helpers.py")'
 
 python3 -c 'from wast import *'
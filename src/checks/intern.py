@@ -0,0 +1,41 @@
+"""
+Equal subtrees share one instance and entries of the intern table
+are released with the trees using them
+
+Usage (from the package root, after ``./build.sh``)::
+
+    python3 -m checks.intern
+"""
+
+import gc
+
+from wast import intern, parse
+from wast.utils import _interned
+
+
+def main(count=2000):
+    first, second = intern(parse("x = y + 1\nx = y + 1\n")).body
+    assert first is second, "equal statements of a parsed tree are not shared"
+    assert first.location is None, "locations are not dropped"
+    first, second = intern(parse("x = y + 1\nx = y + 1\n"), keep_locations=True).body
+    assert first is not second and first.location is not None, "locations are lost"
+    del first, second
+
+    before = len(_interned)
+    trees = [intern(parse(f"def f{i}(x):\n    return x + {i}\n")) for i in range(count)]
+    grown = len(_interned)
+    assert grown - before >= count, "distinct trees were not interned"
+
+    del trees
+    gc.collect()
+    after = len(_interned)
+    # shared singleton nodes stay alive on their classes
+    assert (
+        after - before < 10
+    ), f"{after - before} entries left after dropping the trees"
+
+    print(f"intern table: {before} -> {grown} -> {after} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+``unparse`` with a line length formats like black 26.10.1, the version pinned
+in requirements.txt, so black leaves the built modules as they are
+and formatting them again with black gives the same text
+
+Usage (from the package root, after ``./build.sh``)::
+
+    python3 -m checks.layout [FILE...]
+"""
+
+import sys
+from pathlib import Path
+
+import black
+
+import wast
+from wast import parse, unparse
+
+BLACK_VERSION = "26.10.1"
+
+
+def main(paths=(), line_length=88):
+    assert (
+        black.__version__ == BLACK_VERSION
+    ), f"the layout follows black {BLACK_VERSION}, not {black.__version__}"
+
+    mode = black.Mode(line_length=line_length)
+    root = Path(wast.__file__).parent
+    built = [root / "nodes.py", root / "helpers.py"]
+    for path in built:
+        text = path.read_text()
+        assert black.format_str(text, mode=mode) == text, f"black reformats {path}"
+
+    for path in [*built, *map(Path, paths)]:
+        tree = parse(path.read_text())
+        expected = black.format_str(unparse(tree), mode=mode)
+        assert (
+            unparse(tree, line_length=line_length) == expected
+        ), f"{path} is formatted differently from black"
+
+    print(f"{len(built) + len(paths)} modules formatted the same as black")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
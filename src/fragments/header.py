@@ -1,21 +1,34 @@
 from __future__ import annotations
 
 import ast
-from typing import Any, Optional, Sequence
+from functools import partial
+from itertools import repeat
+from operator import is_
+from typing import Any, Callable, Iterator, Optional, Sequence
 
 import attrs
 
-from .common import Node, TransformerContext, WrappedNode
+from .common import (
+    FieldSpec,
+    Location,
+    Node,
+    TransformerContext,
+    WrappedNode,
+    constant_key,
+)
 from .validators import (
-    DeepIterableConverter,
     ProxyInstanceOfValidator,
+    SequenceConverter,
     convert_identifier,
+    flatten,
+    intern_identifier,
     unwrap_node,
-    unpack_nested,
+    unwrap_nodes,
+    validation_enabled,
 )
 
 
-def to_builtin(node: Node) -> ast.AST:
+def check_node(node: Node) -> Node:
     match node:
         case WrappedNode():
             node = node.__inner__
@@ -24,10 +37,231 @@ def to_builtin(node: Node) -> ast.AST:
         case other:
             raise TypeError("Wrong type")
 
-    return node._to_builtin()
+    return node
+
+
+def same_nodes(new: Sequence[Node], old: Sequence[Node]) -> bool:
+    # identity, equal but rebuilt children still make a new parent
+    return len(new) == len(old) and all(map(is_, new, old))
+
+
+def check_children(cls: type, node: Node, **children: Any) -> None:
+    # runs the validators of the fields which got a new value
+    fields = attrs.fields(cls)
+    for name, value in children.items():
+        if value is getattr(node, name):
+            continue
+
+        field = getattr(fields, name)
+        if isinstance(field.converter, SequenceConverter):
+            if not same_nodes(value, getattr(node, name)):
+                field.converter(value)
+        else:
+            field.validator(node, field, value)
+
+
+def cache_hashes(node: Node) -> int:
+    # hashes the uncached descendants deepest first, so hashing a deep tree
+    # only ever hashes nodes whose children are already cached
+    pending = [node]
+    seen = {id(node)}
+    for parent in pending:
+        for child in parent._children():
+            if id(child) in seen:
+                continue
+            seen.add(id(child))
+            try:
+                child._hash
+            except AttributeError:
+                pending.append(child)
+
+    # parents are listed before their children
+    setattr = object.__setattr__
+    for x in reversed(pending):
+        setattr(x, "_hash", hash(x._hash_key()))
+
+    return node._hash
+
+
+_builtin_classes = {}
+
+
+def get_builtin_class(cls):
+    try:
+        return _builtin_classes[cls]
+    except KeyError:
+        ret = _builtin_classes[cls] = getattr(ast, cls.__name__)
+        return ret
+
+
+# skips the Python level __new__ of the named tuple
+_new_location = partial(tuple.__new__, Location)
+
+
+def builtin_location(node: ast.AST) -> Optional[Location]:
+    try:
+        return _new_location(
+            (node.lineno, node.col_offset, node.end_lineno, node.end_col_offset)
+        )
+    except AttributeError:
+        return None
+
+
+# what ast.fix_missing_locations puts on the root
+DEFAULT_LOCATION = Location(1, 0, 1, 0)
+
+# creates ast nodes without running their __init__
+new_builtin = ast.AST.__new__
+
+LOAD = ast.Load()
+STORE = ast.Store()
+DEL = ast.Del()
+
+# nodes with an expression context
+CONTEXT_NODES = (
+    ast.Name,
+    ast.Attribute,
+    ast.Subscript,
+    ast.Starred,
+    ast.List,
+    ast.Tuple,
+)
+
+
+def set_ctx(node: ast.expr, ctx: ast.expr_context) -> ast.expr:
+    # expr_context is not stored in the nodes, all of them are converted as loads
+    # and targets get theirs from the field holding them,
+    # members of unpacking targets are targets as well
+    stack = [node]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, CONTEXT_NODES):
+            x.ctx = ctx
+
+        if isinstance(x, (ast.Tuple, ast.List)):
+            stack.extend(x.elts)
+        elif isinstance(x, ast.Starred):
+            stack.append(x.value)
+
+    return node
+
+
+def _convert(node: Node, location: Location) -> ast.AST:
+    location = node.location or location
+    return node._to_builtin(_convert, location)
+
+
+def _reused_source(node: Node) -> Optional[ast.AST]:
+    # untouched lazy nodes can convert to their source node, except for
+    # expressions with a context, which is set on them by their parent
+    if type(node) is not node.__class__:
+        source = node._builtin_source()
+        if source is not None and not isinstance(source, CONTEXT_NODES):
+            return source
+
+    return None
+
+
+def _convert_reusing(node: Node, location: Location) -> ast.AST:
+    source = _reused_source(node)
+    if source is not None:
+        return source
+
+    location = node.location or location
+    return node._to_builtin(_convert_reusing, location)
+
+
+def _take(converted: Iterator[ast.AST]) -> Callable[[Node, Location], ast.AST]:
+    # stands in for _convert when the children are already converted
+    return lambda node, location: next(converted)
+
+
+def _convert_flat(root: Node, reuse_sources: bool) -> ast.AST:
+    # same as _convert, with flat loops instead of recursion
+    # first pass lists nodes parents first, children of a node are stored contiguously
+    nodes = [root]
+    locations = [DEFAULT_LOCATION]
+    bounds = []
+    sources = {}
+
+    for i, node in enumerate(nodes):
+        if reuse_sources:
+            source = _reused_source(node)
+            if source is not None:
+                sources[i] = source
+                bounds.append(None)
+                continue
+
+        location = locations[i] = node.location or locations[i]
+        children = node._children()
+        start = len(nodes)
+        nodes.extend(children)
+        locations.extend(repeat(location, len(children)))
+        bounds.append((start, len(nodes)))
+
+    # second pass converts children before their parents
+    results = [None] * len(nodes)
+    for i in range(len(nodes) - 1, -1, -1):
+        if bounds[i] is None:
+            results[i] = sources[i]
+        else:
+            start, stop = bounds[i]
+            converted = _take(iter(results[start:stop]))
+            results[i] = nodes[i]._to_builtin(converted, locations[i])
+
+    return results[0]
+
+
+def to_builtin(node: Node, reuse_sources: bool = False) -> ast.AST:
+    # nodes without a location get the one of their parent,
+    # so the result does not need an ast.fix_missing_locations pass
+    # reuse_sources returns the source nodes of untouched lazy subtrees
+    # instead of new ones, only for callers which don't modify the result
+    node = check_node(node)
+    try:
+        return (_convert_reusing if reuse_sources else _convert)(node, DEFAULT_LOCATION)
+    except RecursionError:
+        # deep trees are converted without a frame per level
+        return _convert_flat(node, reuse_sources)
+
+
+def _convert_builtin(node: ast.AST) -> Node:
+    return BUILTIN_NODES[node.__class__]._from_builtin(node, _convert_builtin)
+
+
+def _take_builtin(converted: Iterator[Node]) -> Callable[[ast.AST], Node]:
+    # stands in for _convert_builtin when the children are already converted
+    return lambda node: next(converted)
+
+
+def _convert_builtin_flat(root: ast.AST) -> Node:
+    # same as _convert_builtin, with flat loops instead of recursion
+    # first pass lists nodes parents first, children of a node are stored contiguously
+    nodes = [root]
+    classes = []
+    bounds = []
+
+    for node in nodes:
+        cls = BUILTIN_NODES[node.__class__]
+        start = len(nodes)
+        nodes.extend(cls._builtin_children(node))
+        classes.append(cls)
+        bounds.append((start, len(nodes)))
+
+    # second pass converts children before their parents
+    results = [None] * len(nodes)
+    for i in range(len(nodes) - 1, -1, -1):
+        start, stop = bounds[i]
+        converted = _take_builtin(iter(results[start:stop]))
+        results[i] = classes[i]._from_builtin(nodes[i], converted)
+
+    return results[0]
 
 
 def from_builtin(node: ast.AST) -> Node:
     assert isinstance(node, ast.AST)
-    t = node.__class__.__name__
-    return NODES[t]._from_builtin(node)
+    try:
+        return _convert_builtin(node)
+    except RecursionError:
+        # deep trees are converted without a frame per level
+        return _convert_builtin_flat(node)
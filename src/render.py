@@ -8,14 +8,37 @@ from activated_wast import _, get_fragment, w, unparse
 from upstream import asdl, dfns
 
 
+def mk_type_proxy(val):
+    return w.Lambda(w.arguments(), val)
+
+
 def mk_io_validator(val):
-    return _.ProxyInstanceOfValidator(w.Lambda(w.arguments(), val))
+    return _.ProxyInstanceOfValidator(mk_type_proxy(val))
 
 
 def const(val):
     return w.Constant(val)
 
 
+# leaf nodes sharing one instance per singleton value, class name -> field name
+SHARED_LEAVES = {"Constant": "value", "MatchSingleton": "value"}
+SHARED_VALUES = [None, True, False, ...]
+
+# expression context of the fields holding assignment and deletion targets,
+# the others are loads
+TARGET_FIELDS = {
+    "Assign": {"targets": "STORE"},
+    "AugAssign": {"target": "STORE"},
+    "AnnAssign": {"target": "STORE"},
+    "For": {"target": "STORE"},
+    "AsyncFor": {"target": "STORE"},
+    "comprehension": {"target": "STORE"},
+    "withitem": {"optional_vars": "STORE"},
+    "NamedExpr": {"target": "STORE"},
+    "Delete": {"targets": "DEL"},
+}
+
+
 @attrs.define
 class Field:
     spec: asdl.Field
@@ -44,7 +67,7 @@ class Field:
     def is_object(self):
         return self.type not in {"identifier", "string", "int", "constant"}
 
-    def mk_transformer(self, value_expr, mk_fn):
+    def mk_transformer(self, value_expr, mk_fn, as_tuple=False):
         if self.is_object:
             if self.opt:
                 return w.IfExp(
@@ -55,17 +78,64 @@ class Field:
                     ),
                 )
             elif self.seq:
-                return w.ListComp(
+                ret = w.ListComp(
                     elt=mk_fn(_.x),
                     generators=[
                         w.comprehension(is_async=0, iter=value_expr, target=_.x)
                     ],
                 )
+                return _.tuple(ret) if as_tuple else ret
             else:
                 return mk_fn(value_expr)
+        elif self.seq:
+            return _.tuple(value_expr) if as_tuple else _.list(value_expr)
         else:
             return value_expr
 
+    @property
+    def rendered_spec(self):
+        flags = {}
+        if self.seq:
+            flags |= dict(seq=const(True))
+        if self.opt:
+            flags |= dict(opt=const(True))
+
+        return _.FieldSpec(
+            const(self.name), const(self.type), const(self.is_object), **flags
+        )
+
+    def mk_child(self, value_expr):
+        if self.seq:
+            return w.Starred(value_expr)
+
+        if self.opt:
+            return w.Starred(
+                w.IfExp(
+                    body=w.Tuple(),
+                    orelse=w.Tuple([value_expr]),
+                    test=w.Compare(
+                        left=value_expr, comparators=[const(None)], ops=[w.Is()]
+                    ),
+                )
+            )
+
+        return value_expr
+
+    def mk_key(self, value_expr):
+        if self.type == "constant":
+            return _.constant_key(value_expr)
+
+        return value_expr
+
+    def mk_unwrapping_transformer(self, value_expr, mk_fn):
+        if not self.is_object:
+            return value_expr
+
+        if self.seq:
+            return _.unwrap_nodes(self.mk_transformer(value_expr, mk_fn))
+
+        return self.mk_transformer(value_expr, lambda x: _.unwrap_node(mk_fn(x)))
+
     @property
     def rendered(self):
         spec = self.spec
@@ -117,18 +187,12 @@ class Field:
 
             field_args |= dict(default=w.Constant(None))
         elif spec.seq:
+            assert converters, "sequences of plain values are not supported"
+            converter = _.SequenceConverter(
+                const(self.name), mk_type_proxy(annotation), converter
+            )
             annotation = _.Sequence[annotation]
 
-            if validators:
-                field_args |= dict(
-                    validator=_.attrs.validators.deep_iterable(validator)
-                )
-
-            if converters:
-                converter = _.attrs.converters.pipe(_.unpack_nested, _.DeepIterableConverter(converter))
-            else:
-                converter = _.unpack_nested
-
             field_args |= dict(factory=_.tuple, converter=converter)
         else:
             if validators:
@@ -157,39 +221,388 @@ class FieldsMixin:
             key=lambda x: (x.has_default, x.name),
         )
 
+    @property
+    def has_ctx(self):
+        return any(x.type == "expr_context" for x in self.spec.fields)
+
     @property
     def to_builtin(self):
-        kwargs = {
-            x.name: x.mk_transformer(_.self._(x.name), lambda x: _.to_builtin(x))
+        targets = TARGET_FIELDS.get(self.name, {})
+
+        def convert(field):
+            ctx = targets.get(field.name)
+
+            def convert_child(value_expr):
+                ret = _.convert(value_expr, _.location)
+                return ret if ctx is None else _.set_ctx(ret, _(ctx))
+
+            return field.mk_transformer(_.self._(field.name), convert_child)
+
+        # ast node __init__ is slow, attributes are set directly instead
+        body = [w.Assign(targets=[_.ret], value=_.new_builtin(_.ast._(self.name)))]
+        body += [
+            w.Assign(targets=[_.ret._(x.name)], value=convert(x))
             for x in self.parsed_fields
-        }
-        ret = _.ast._(self.name)(**kwargs)
+        ]
+        if self.has_ctx:
+            body.append(w.Assign(targets=[_.ret.ctx], value=_.LOAD))
+        if self.attributes:
+            body.append(
+                w.Assign(
+                    targets=[w.Tuple([_.ret._(x.name) for x in self.attributes])],
+                    value=_.location,
+                )
+            )
 
         return w.FunctionDef(
             name="_to_builtin",
+            args=w.arguments(
+                args=[
+                    w.arg(arg="self"),
+                    w.arg(arg="convert"),
+                    w.arg(arg="location"),
+                ],
+            ),
+            body=[*body, w.Return(_.ret)],
+        )
+
+    @property
+    def children(self):
+        children = [
+            x.mk_child(_.self._(x.name)) for x in self.parsed_fields if x.is_object
+        ]
+
+        return w.FunctionDef(
+            name="_children",
             args=w.arguments(
                 args=[w.arg(arg="self")],
             ),
-            body=[w.Return(ret)],
+            body=[w.Return(w.List(children))],
         )
 
     @property
     def from_builtin(self):
-        kwargs = {
-            x.name: x.mk_transformer(_.node._(x.name), lambda x: _.from_builtin(x))
-            for x in self.parsed_fields
-        }
-        ret = _.cls(**kwargs)
+        def convert(field):
+            if field.is_object and field.seq:
+                return _.tuple(_.map(_.convert, _.node._(field.name)))
+
+            return field.mk_transformer(
+                _.node._(field.name), lambda x: _.convert(x), as_tuple=True
+            )
+
+        # positional, _make takes the fields in order
+        args = [convert(x) for x in self.parsed_fields]
+        if self.is_located:
+            args.append(_.builtin_location(_.node))
+        ret = _.cls._make(*args)
 
         return w.FunctionDef(
             name="_from_builtin",
             decorator_list=[_.classmethod],
             args=w.arguments(
-                args=[w.arg(arg="cls"), w.arg(arg="node")],
+                args=[w.arg(arg="cls"), w.arg(arg="node"), w.arg(arg="convert")],
             ),
             body=[w.Return(ret)],
         )
 
+    @property
+    def builtin_children(self):
+        children = [
+            x.mk_child(_.node._(x.name)) for x in self.parsed_fields if x.is_object
+        ]
+
+        return w.FunctionDef(
+            name="_builtin_children",
+            decorator_list=[_.staticmethod],
+            args=w.arguments(
+                args=[w.arg(arg="node")],
+            ),
+            body=[w.Return(w.List(children))],
+        )
+
+    @property
+    def field_specs(self):
+        return w.Assign(
+            targets=[_._field_specs],
+            value=w.Tuple([x.rendered_spec for x in self.parsed_fields]),
+        )
+
+    @property
+    def eq(self):
+        identical = w.If(
+            test=w.Compare(left=_.self, ops=[w.Is()], comparators=[_.other]),
+            body=[w.Return(const(True))],
+        )
+        other_class = w.If(
+            test=w.Compare(
+                left=_.other._("__class__"),
+                ops=[w.IsNot()],
+                comparators=[_.self._("__class__")],
+            ),
+            body=[w.Return(_.NotImplemented)],
+        )
+        different_hash = w.If(
+            test=w.Compare(
+                left=_.hash(_.self), ops=[w.NotEq()], comparators=[_.hash(_.other)]
+            ),
+            body=[w.Return(const(False))],
+        )
+        if not self.parsed_fields:
+            ret = const(True)
+        else:
+            ret = w.Compare(
+                left=w.Tuple([x.mk_key(_.self._(x.name)) for x in self.parsed_fields]),
+                ops=[w.Eq()],
+                comparators=[
+                    w.Tuple([x.mk_key(_.other._(x.name)) for x in self.parsed_fields])
+                ],
+            )
+
+        return w.FunctionDef(
+            name="__eq__",
+            args=w.arguments(
+                args=[w.arg(arg="self"), w.arg(arg="other")],
+            ),
+            body=[identical, other_class, different_hash, w.Return(ret)],
+        )
+
+    @property
+    def hash(self):
+        cached = w.Try(
+            body=[w.Return(_.self._hash)],
+            handlers=[w.ExceptHandler(type=_.AttributeError, body=[w.Pass()])],
+        )
+        if self.has_children:
+            # children first, so deep trees do not recurse through __hash__
+            body = [cached, w.Return(_.cache_hashes(_.self))]
+        else:
+            compute = w.Assign(targets=[_.ret], value=_.hash(self.hash_key_tuple))
+            store = w.Expr(_.object._("__setattr__")(_.self, const("_hash"), _.ret))
+            body = [cached, compute, store, w.Return(_.ret)]
+
+        return w.FunctionDef(
+            name="__hash__",
+            args=w.arguments(
+                args=[w.arg(arg="self")],
+            ),
+            body=body,
+        )
+
+    @property
+    def hash_key_tuple(self):
+        return w.Tuple(
+            [_(self.name), *(x.mk_key(_.self._(x.name)) for x in self.parsed_fields)]
+        )
+
+    @property
+    def has_children(self):
+        return any(x.is_object for x in self.parsed_fields)
+
+    @property
+    def hash_key(self):
+        return w.FunctionDef(
+            name="_hash_key",
+            args=w.arguments(
+                args=[w.arg(arg="self")],
+            ),
+            body=[w.Return(self.hash_key_tuple)],
+        )
+
+    @property
+    def is_located(self):
+        # nodes with lineno, col_offset, etc. attributes in the ASDL
+        return bool(self.attributes)
+
+    @property
+    def is_singleton(self):
+        # located nodes like Pass differ by their source location
+        return not self.parsed_fields and not self.is_located
+
+    @property
+    def shared_field(self):
+        return SHARED_LEAVES.get(self.name)
+
+    def mk_shared_lookup(self, cls_expr, with_location=False):
+        if self.is_singleton:
+            return [w.Return(cls_expr._instance)]
+
+        if self.shared_field is None:
+            return []
+
+        lookup = [
+            w.Assign(
+                targets=[_.shared],
+                value=cls_expr._shared.get(_.id(_(self.shared_field))),
+            ),
+            w.If(
+                test=w.Compare(
+                    left=_.shared, ops=[w.IsNot()], comparators=[const(None)]
+                ),
+                body=[w.Return(_.shared)],
+            ),
+        ]
+        rest = [
+            w.Compare(left=_(x.name), ops=[w.Is()], comparators=[const(None)])
+            for x in self.parsed_fields
+            if x.name != self.shared_field
+        ]
+        if with_location and self.is_located:
+            # shared instances have no location
+            rest.append(
+                w.Compare(left=_._location, ops=[w.Is()], comparators=[const(None)])
+            )
+        match rest:
+            case []:
+                return lookup
+            case [test]:
+                return [w.If(test=test, body=lookup)]
+            case _:
+                return [w.If(test=w.BoolOp(op=w.And(), values=rest), body=lookup)]
+
+    @property
+    def new(self):
+        assert not any(x.seq for x in self.parsed_fields)
+
+        return w.FunctionDef(
+            name="__new__",
+            args=w.arguments(
+                args=[
+                    w.arg(arg="cls"),
+                    *(w.arg(arg=x.name) for x in self.parsed_fields),
+                ],
+                # copy and pickle call __new__ without arguments
+                defaults=[
+                    const(None) if x.has_default else _.attrs.NOTHING
+                    for x in self.parsed_fields
+                ],
+            ),
+            body=(
+                self.mk_shared_lookup(_.cls)
+                if self.is_singleton
+                else [
+                    *self.mk_shared_lookup(_.cls),
+                    w.Return(_.object._("__new__")(_.cls)),
+                ]
+            ),
+        )
+
+    @property
+    def shared_instances(self):
+        if self.is_singleton:
+            return [
+                w.Assign(
+                    targets=[_(self.name)._instance],
+                    value=_.object._("__new__")(_(self.name)),
+                )
+            ]
+
+        values = {
+            x.name: _.x if x.name == self.shared_field else const(None)
+            for x in self.parsed_fields
+        }
+        instances = w.DictComp(
+            key=_.id(_.x),
+            value=_(self.name)._make(**values),
+            generators=[
+                w.comprehension(
+                    is_async=0,
+                    iter=w.Tuple([const(x) for x in SHARED_VALUES]),
+                    target=_.x,
+                )
+            ],
+        )
+        return [
+            w.Assign(targets=[_(self.name)._shared], value=w.Dict()),
+            w.Expr(_(self.name)._shared.update(instances)),
+        ]
+
+    @property
+    def init(self):
+        fields = self.parsed_fields
+
+        def unchecked(field):
+            value = _(field.name)
+            convert = _.unwrap_node
+            if field.type == "identifier":
+                convert = _.intern_identifier
+            elif not field.is_object:
+                return value
+
+            if field.seq:
+                return _.flatten(value, convert)
+
+            if field.opt and field.type == "identifier":
+                return w.IfExp(
+                    test=w.Compare(left=value, ops=[w.Is()], comparators=[const(None)]),
+                    body=const(None),
+                    orelse=convert(value),
+                )
+
+            return convert(value)
+
+        # attrs validators and converters check the setting on every call,
+        # without validation the fields are only unwrapped and flattened
+        checked = w.If(
+            test=_.validation_enabled(),
+            body=[
+                w.Expr(_.self._("__attrs_init__")(*[_(x.name) for x in fields])),
+                w.Return(),
+            ],
+        )
+        setattr_ = w.Assign(targets=[_._setattr], value=_.object._("__setattr__"))
+        assignments = [
+            w.Expr(_._setattr(_.self, const(x.name), unchecked(x))) for x in fields
+        ]
+
+        return w.FunctionDef(
+            name="__init__",
+            args=w.arguments(
+                args=[w.arg(arg="self"), *(w.arg(arg=x.name) for x in fields)],
+                defaults=[
+                    const(()) if x.seq else const(None) for x in fields if x.has_default
+                ],
+            ),
+            body=[checked, setattr_, *assignments],
+        )
+
+    @property
+    def make(self):
+        instance = w.Assign(targets=[_.self], value=_.object._("__new__")(_._cls))
+        setattr_ = w.Assign(targets=[_._setattr], value=_.object._("__setattr__"))
+        assignments = [
+            w.Expr(_._setattr(_.self, const(x.name), _(x.name)))
+            for x in self.parsed_fields
+        ]
+        args = [w.arg(arg=x.name) for x in self.parsed_fields]
+        defaults = []
+        if self.is_located:
+            assignments.append(
+                w.Expr(_._setattr(_.self, const("_location"), _._location))
+            )
+            args.append(w.arg(arg="_location"))
+            defaults.append(const(None))
+        if assignments:
+            assignments = [setattr_, *assignments]
+
+        return w.FunctionDef(
+            name="_make",
+            decorator_list=[_.classmethod],
+            args=w.arguments(
+                args=[w.arg(arg="_cls"), *args],
+                defaults=defaults,
+            ),
+            body=(
+                self.mk_shared_lookup(_._cls)
+                if self.is_singleton
+                else [
+                    *self.mk_shared_lookup(_._cls, with_location=True),
+                    instance,
+                    *assignments,
+                    w.Return(_.self),
+                ]
+            ),
+        )
+
     @property
     def transform(self):
         inner_context = w.Assign(
@@ -199,14 +612,66 @@ class FieldsMixin:
                 original=_.self,
             ),
         )
-        kwargs = {
-            x.name: x.mk_transformer(
-                _.self._(x.name),
-                lambda x: x._transform(_.node_transformer, _.inner_context),
+        children = [x for x in self.parsed_fields if x.is_object]
+        if not children:
+            return w.FunctionDef(
+                name="_transform",
+                args=w.arguments(
+                    args=[
+                        w.arg(arg="self"),
+                        w.arg(arg="node_transformer"),
+                        w.arg(arg="context"),
+                    ],
+                ),
+                body=[w.Return(_.node_transformer(_.self, _.context))],
             )
+
+        transformed_children = [
+            w.Assign(
+                targets=[_(x.name)],
+                value=x.mk_unwrapping_transformer(
+                    _.self._(x.name),
+                    lambda x: x._transform(_.node_transformer, _.inner_context),
+                ),
+            )
+            for x in children
+        ]
+        # unchanged children keep the original node instead of a copy
+        same = [
+            (
+                _.same_nodes(_(x.name), _.self._(x.name))
+                if x.seq
+                else w.Compare(
+                    left=_(x.name), ops=[w.Is()], comparators=[_.self._(x.name)]
+                )
+            )
+            for x in children
+        ]
+        kwargs = {
+            x.name: _(x.name) if x.is_object else _.self._(x.name)
             for x in self.parsed_fields
         }
-        transformed = w.Assign(targets=[_.transformed], value=_(self.name)(**kwargs))
+        if self.is_located:
+            kwargs["_location"] = _.self.location
+        # transformer functions can return anything, unlike ast.parse
+        check = w.If(
+            test=_.validation_enabled(),
+            body=[
+                w.Expr(
+                    _.check_children(
+                        _(self.name), _.self, **{x.name: _(x.name) for x in children}
+                    )
+                )
+            ],
+        )
+        transformed = w.If(
+            test=same[0] if len(same) == 1 else w.BoolOp(op=w.And(), values=same),
+            body=[w.Assign(targets=[_.transformed], value=_.self)],
+            orelse=[
+                check,
+                w.Assign(targets=[_.transformed], value=_(self.name)._make(**kwargs)),
+            ],
+        )
         ret = _.node_transformer(_.transformed, _.context)
 
         return w.FunctionDef(
@@ -218,22 +683,37 @@ class FieldsMixin:
                     w.arg(arg="context"),
                 ],
             ),
-            body=[inner_context, transformed, w.Return(ret)],
+            body=[inner_context, *transformed_children, transformed, w.Return(ret)],
         )
 
     @property
     def rendered(self):
+        is_shared = self.is_singleton or self.shared_field is not None
+
         node = w.ClassDef(
-            decorator_list=[_.attrs.frozen()],
+            decorator_list=[_.attrs.frozen(eq=const(False))],
             bases=[_(self.base_name)],
             name=self.name,
             body=[
                 *chain.from_iterable(x.rendered for x in self.parsed_fields),
+                self.field_specs,
+                *([self.init] if self.parsed_fields else []),
+                *([self.new] if is_shared else []),
+                self.eq,
+                self.hash,
+                self.hash_key,
+                self.make,
+                self.children,
                 self.to_builtin,
+                self.builtin_children,
                 self.from_builtin,
                 self.transform,
             ],
         )
+
+        if is_shared:
+            return [node, *self.shared_instances]
+
         return [node]
 
 
@@ -241,6 +721,7 @@ class FieldsMixin:
 class Constructor(FieldsMixin):
     parent_name: str
     spec: asdl.Constructor
+    attributes: list = attrs.field(factory=list)
 
     @property
     def name(self):
@@ -262,14 +743,17 @@ class Sum:
 
     @property
     def parsed_constructors(self):
-        return [Constructor(self.name, spec) for spec in self.spec.types]
+        return [
+            Constructor(self.name, spec, self.spec.attributes)
+            for spec in self.spec.types
+        ]
 
     @property
     def rendered(self):
         base = w.ClassDef(
             bases=[_.Node],
             name=self.name,
-            body=[w.Pass()],
+            body=[w.Assign(targets=[_.__slots__], value=w.Tuple())],
         )
         return [
             base,
@@ -286,6 +770,10 @@ class Product(FieldsMixin):
     def nodes(self):
         return [self]
 
+    @property
+    def attributes(self):
+        return self.spec.attributes
+
     @property
     def base_name(self):
         return "Node"
@@ -319,11 +807,19 @@ class TopLevel:
             value=_.dict(**{x.name: _(x.name) for x in self.nodes}),
             targets=[_.NODES],
         )
+        builtin_registry = w.Assign(
+            value=w.Dict(
+                keys=[_.ast._(x.name) for x in self.nodes],
+                values=[_(x.name) for x in self.nodes],
+            ),
+            targets=[_.BUILTIN_NODES],
+        )
         return w.Module(
             [
                 *get_fragment("header"),
                 *chain.from_iterable(x.rendered for x in self.dfns_parsed),
                 registry,
+                builtin_registry,
             ]
         )
 
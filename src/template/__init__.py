@@ -1,11 +1,44 @@
 from . import nodes as w
+from .archive import Archive, write_archive
+from .cache import ParseCache
+from .common import Location
+from .compact import CompactTree
 from .helpers import _
-from .utils import parse, mk_transformer, unparse
+from .serialization import dumps, loads
+from .unparser import UnparseCache, iter_unparse, unparse_to
+from .utils import (
+    TransformResult,
+    compile,
+    intern,
+    load_transformer,
+    mk_transformer,
+    parse,
+    parse_many,
+    unparse,
+)
+from .validators import set_validation, validation
 
 __all__ = [
+    "Archive",
+    "CompactTree",
+    "Location",
+    "ParseCache",
+    "TransformResult",
+    "UnparseCache",
+    "compile",
+    "dumps",
+    "loads",
+    "intern",
+    "load_transformer",
     "parse",
+    "parse_many",
     "unparse",
+    "unparse_to",
+    "iter_unparse",
     "mk_transformer",
+    "set_validation",
+    "validation",
+    "write_archive",
     "w",
     "_",
 ]
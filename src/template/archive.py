@@ -0,0 +1,102 @@
+import marshal
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Iterable, Iterator, Mapping
+
+from .common import Node, create_temporary
+from .serialization import dumps, loads
+
+MAGIC = b"WASTARCH"
+FORMAT_VERSION = 1
+# magic, format version, index offset and index length
+HEADER = struct.Struct("<8sIQQ")
+
+
+def write_archive(
+    path: str | os.PathLike, trees: Mapping[str, Node] | Iterable[tuple[str, Node]]
+) -> None:
+    """
+    Stores trees serialized by ``dumps`` in one file, with an index of their keys
+    """
+    if isinstance(trees, Mapping):
+        trees = trees.items()
+
+    path = Path(path)
+    index = {}
+    # readers of an existing archive keep seeing the old file until it is replaced
+    fd, tmp = create_temporary(path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(bytes(HEADER.size))
+            for key, node in trees:
+                if not isinstance(key, str):
+                    raise TypeError(f"Archive keys are strings, got {key!r}")
+
+                data = dumps(node)
+                index[key] = (f.tell(), len(data))
+                f.write(data)
+
+            data = marshal.dumps(index)
+            index_offset = f.tell()
+            f.write(data)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, index_offset, len(data)))
+
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Archive(Mapping[str, Node]):
+    """
+    Read only mapping over a file written by ``write_archive``
+
+    The file is memory mapped, only the index is read on open
+    and a tree is only read and loaded when it is looked up
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if len(self._mmap) < HEADER.size:
+                raise ValueError(f"{path} is not a wast archive")
+
+            magic, version, index_offset, index_length = HEADER.unpack_from(self._mmap)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a wast archive")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported archive format version {version}")
+
+            self._index = marshal.loads(
+                self._mmap[index_offset : index_offset + index_length]
+            )
+        except BaseException:
+            self._mmap.close()
+            raise
+
+    def __getitem__(self, key: str) -> Node:
+        offset, length = self._index[key]
+        return loads(self._mmap[offset : offset + length])
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __enter__(self) -> "Archive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
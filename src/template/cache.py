@@ -0,0 +1,182 @@
+import hashlib
+import marshal
+import os
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from . import nodes
+from .common import LRUCache, Node, create_temporary
+from .serialization import FORMAT_VERSION, dumps, loads
+
+# enough for the templates and fragments of a large project
+PARSE_CACHE_SIZE = 2**10
+SUFFIX = ".wast"
+# entries stored by other processes are seen when the directory is scanned again
+RESCAN_INTERVAL = 2**8
+
+
+def _generated_module() -> bytes:
+    try:
+        return Path(nodes.__file__).read_bytes()
+    except (OSError, TypeError):
+        pass
+
+    # zipped and sourceless installs, where the source can't be read
+    spec = nodes.__spec__
+    try:
+        return marshal.dumps(spec.loader.get_code(spec.name))
+    except Exception:
+        return repr([x._field_specs for x in nodes.NODES.values()]).encode()
+
+
+def _schema_key() -> str:
+    # stored trees are only valid for the same node classes and the same parser,
+    # the generated module changes with them even when the package version does not
+    generated = hashlib.sha256(_generated_module()).hexdigest()
+    return repr((FORMAT_VERSION, sys.version_info[:2], generated))
+
+
+SCHEMA_KEY = _schema_key().encode()
+
+
+def source_key(text: str) -> str:
+    return hashlib.sha256(
+        SCHEMA_KEY + text.encode("utf-8", "surrogatepass")
+    ).hexdigest()
+
+
+class ParseCache:
+    """
+    Trees returned by ``parse(text, cache=...)``, keyed by a hash of the source
+
+    The ``maxsize`` most recently used trees are kept in memory,
+    with ``directory`` set trees are also stored there as ``dumps`` output,
+    so other processes and later runs can load them instead of parsing
+
+    The directory is limited to ``disk_maxsize`` entries and ``disk_maxbytes`` bytes,
+    least recently used entries are removed first, entries stored by other
+    processes count once the directory is scanned again, every
+    ``RESCAN_INTERVAL`` stores
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str | os.PathLike] = None,
+        maxsize: int = PARSE_CACHE_SIZE,
+        disk_maxsize: Optional[int] = None,
+        disk_maxbytes: Optional[int] = None,
+    ):
+        self.directory = None if directory is None else Path(directory)
+        self.memory = LRUCache(maxsize)
+        self.disk_maxsize = disk_maxsize
+        self.disk_maxbytes = disk_maxbytes
+        # sizes of the entries on disk from the least recently used, for eviction
+        self._entries = None
+        self._bytes = 0
+        self._stores = 0
+
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, text: str) -> Optional[Node]:
+        key = source_key(text)
+        ret = self.memory.get(key)
+        if ret is None and self.directory is not None:
+            ret = self._load(key)
+            if ret is not None:
+                self.memory[key] = ret
+
+        return ret
+
+    def put(self, text: str, node: Node) -> None:
+        key = source_key(text)
+        self.memory[key] = node
+        if self.directory is not None:
+            self._store(key, node)
+
+    def _load(self, key: str) -> Optional[Node]:
+        path = self.directory / (key + SUFFIX)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+        # modification time is the last use, for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        if self._entries is not None and key in self._entries:
+            self._entries.move_to_end(key)
+
+        try:
+            return loads(data)
+        except Exception:
+            # corrupt or written by an incompatible version, parse again and overwrite
+            return None
+
+    def _store(self, key: str, node: Node) -> None:
+        data = dumps(node)
+        # readers in other processes only ever see complete files
+        fd, tmp = create_temporary(self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.directory / (key + SUFFIX))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self._evict(key, len(data))
+
+    def _scan(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append(
+                    (stat.st_mtime, entry.name[: -len(SUFFIX)], stat.st_size)
+                )
+
+        entries.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in entries)
+        self._bytes = sum(self._entries.values())
+        self._stores = 0
+
+    def _evict(self, key: str, size: int) -> None:
+        if self.disk_maxsize is None and self.disk_maxbytes is None:
+            return
+
+        # sizes are tracked between scans instead of listing the directory every time
+        if self._entries is None or self._stores >= RESCAN_INTERVAL:
+            self._scan()
+        else:
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+
+        self._stores += 1
+        entries = self._entries
+        while entries and (
+            (self.disk_maxsize is not None and len(entries) > self.disk_maxsize)
+            or (self.disk_maxbytes is not None and self._bytes > self.disk_maxbytes)
+        ):
+            key, size = entries.popitem(last=False)
+            self._bytes -= size
+            # other processes may be removing the same entries
+            try:
+                os.unlink(self.directory / (key + SUFFIX))
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self._entries = None
+        if self.directory is not None:
+            for path in self.directory.glob("*" + SUFFIX):
+                path.unlink(missing_ok=True)
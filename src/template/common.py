@@ -1,17 +1,128 @@
-from typing import Sequence
+import os
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional, Sequence
 
 import attrs
 
 
+class Location(NamedTuple):
+    """
+    Source span of a node, same meaning as the ``ast`` attributes of the same names
+    """
+
+    lineno: int
+    col_offset: int
+    end_lineno: Optional[int] = None
+    end_col_offset: Optional[int] = None
+
+
+def create_temporary(directory: str | os.PathLike) -> tuple[int, str]:
+    """
+    Creates a new file for writing like ``tempfile.mkstemp``, but with the
+    permissions of a file created by ``open``, returns its descriptor and path
+    """
+    # mkstemp files are private to the owner, here the umask applies,
+    # without reading it, which would mean changing it for all threads
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        path = os.path.join(directory, f"tmp{os.urandom(8).hex()}.tmp")
+        try:
+            return os.open(path, flags, 0o666), path
+        except FileExistsError:
+            continue
+
+
 class Node:
-    pass
+    # structural hash, computed on first use
+    # source location, not part of equality and hashing
+    __slots__ = ("_hash", "_location")
+
+    @property
+    def location(self) -> Optional[Location]:
+        try:
+            return self._location
+        except AttributeError:
+            return None
+
+    def __reduce__(self):
+        # copy and pickle go through _make, the state attrs saves has only the fields
+        args = tuple(getattr(self, x.name) for x in self._field_specs)
+        location = self.location
+        if location is not None:
+            args += (location,)
+
+        return self.__class__._make, args
 
 
 class WrappedNode:
     pass
 
 
+@attrs.frozen
+class FieldSpec:
+    """
+    Node field description rendered from the ASDL, available as ``_field_specs`` on node classes
+    """
+
+    name: str
+    type: str
+    is_node: bool
+    seq: bool = False
+    opt: bool = False
+
+
 @attrs.define
 class TransformerContext:
     parents: Sequence[Node]
     original: Node
+
+
+def constant_key(value: Any) -> Any:
+    """
+    Comparison key for constant values, unlike plain ``==`` it tells apart
+    ``1``, ``1.0`` and ``True`` as well as ``0.0`` and ``-0.0``
+    """
+    match value:
+        case tuple():
+            return (tuple, tuple(constant_key(x) for x in value))
+        case frozenset():
+            return (frozenset, frozenset(constant_key(x) for x in value))
+        case float() | complex():
+            return (value.__class__, repr(value))
+        case other:
+            return (value.__class__, value)
+
+
+class LRUCache:
+    """
+    Mapping keeping only the ``maxsize`` most recently used entries
+    """
+
+    __slots__ = ("maxsize", "_data")
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        data = self._data
+        try:
+            value = data[key]
+            data.move_to_end(key)
+        except KeyError:
+            return default
+
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        data = self._data
+        data[key] = value
+        data.move_to_end(key)
+        while len(data) > self.maxsize:
+            data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        self._data.clear()
@@ -0,0 +1,281 @@
+import marshal
+from array import array
+from typing import Any, Iterator, Optional, Type
+
+import attrs
+
+from .common import Location, Node, constant_key
+from .nodes import NODES
+
+FORMAT_VERSION = 2
+
+# 32 bit signed indices, -1 stands for a missing optional node
+INDEX_TYPECODE = "i"
+# locations take four slots per node, -1 stands for a missing value
+LOCATION_WIDTH = 4
+KIND_TYPECODE = "H"
+
+
+def field_width(cls: Type[Node]) -> int:
+    # sequences take two slots: start and stop in the items array
+    return sum(2 if x.seq else 1 for x in cls._field_specs)
+
+
+@attrs.define
+class _Packer:
+    classes: tuple[Type[Node], ...]
+    codes: dict[Type[Node], int]
+
+    kinds: array = attrs.field(factory=lambda: array(KIND_TYPECODE))
+    offsets: array = attrs.field(factory=lambda: array(INDEX_TYPECODE))
+    fields: array = attrs.field(factory=lambda: array(INDEX_TYPECODE))
+    items: array = attrs.field(factory=lambda: array(INDEX_TYPECODE))
+    values: list = attrs.field(factory=list)
+    value_indices: dict = attrs.field(factory=dict)
+    locations: array = attrs.field(factory=lambda: array(INDEX_TYPECODE))
+    located: bool = False
+
+    def add_value(self, value: Any) -> int:
+        key = constant_key(value)
+        try:
+            return self.value_indices[key]
+        except KeyError:
+            pass
+
+        index = self.value_indices[key] = len(self.values)
+        self.values.append(value)
+        return index
+
+    def add_node(self, node: Node) -> int:
+        # explicit stack instead of recursion, so tree depth is not limited by frames
+        # entries are a node and the slot in fields or items taking its index
+        ret = len(self.kinds)
+        stack = [(node, None, 0)]
+
+        while stack:
+            node, slots, slot = stack.pop()
+            cls = node.__class__
+            index = len(self.kinds)
+            if slots is not None:
+                slots[slot] = index
+
+            self.kinds.append(self.codes[cls])
+            location = node.location
+            if location is None:
+                self.locations.extend([-1] * LOCATION_WIDTH)
+            else:
+                self.located = True
+                self.locations.extend([-1 if x is None else x for x in location])
+
+            pos = len(self.fields)
+            self.offsets.append(pos)
+            self.fields.extend([0] * field_width(cls))
+
+            children = []
+            for spec in cls._field_specs:
+                value = getattr(node, spec.name)
+
+                if spec.seq:
+                    start = len(self.items)
+                    if spec.is_node:
+                        # children are numbered when they are visited
+                        self.items.extend([0] * len(value))
+                        children.extend(
+                            (x, self.items, start + i) for i, x in enumerate(value)
+                        )
+                    else:
+                        self.items.extend([self.add_value(x) for x in value])
+
+                    self.fields[pos] = start
+                    self.fields[pos + 1] = len(self.items)
+                    pos += 2
+                elif spec.is_node:
+                    if value is None:
+                        self.fields[pos] = -1
+                    else:
+                        children.append((value, self.fields, pos))
+                    pos += 1
+                else:
+                    self.fields[pos] = self.add_value(value)
+                    pos += 1
+
+            # numbered in pre-order, like the recursive walk
+            stack.extend(reversed(children))
+
+        return ret
+
+
+@attrs.frozen
+class CompactTree:
+    """
+    Struct-of-arrays encoding of a tree for keeping many large trees in memory
+
+    Nodes are numbered in pre-order (root is ``0``),
+    and materialised into regular ``w.*`` instances only by ``node()`` and ``root``,
+    source locations are kept unless no node has one
+    """
+
+    classes: tuple[Type[Node], ...]
+    kinds: array
+    offsets: array
+    fields: array
+    items: array
+    values: tuple[Any, ...]
+    # empty for trees without locations
+    locations: array = attrs.field(factory=lambda: array(INDEX_TYPECODE))
+
+    @classmethod
+    def from_node(cls, node: Node) -> "CompactTree":
+        classes = tuple(NODES.values())
+        packer = _Packer(classes, {x: i for i, x in enumerate(classes)})
+        packer.add_node(node)
+
+        return cls(
+            classes=classes,
+            kinds=packer.kinds,
+            offsets=packer.offsets,
+            fields=packer.fields,
+            items=packer.items,
+            values=tuple(packer.values),
+            locations=packer.locations if packer.located else array(INDEX_TYPECODE),
+        )
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @property
+    def root(self) -> Node:
+        return self.node(0)
+
+    def node_type(self, index: int) -> Type[Node]:
+        return self.classes[self.kinds[index]]
+
+    def location(self, index: int) -> Optional[Location]:
+        """
+        Source location of a node, without materialising it
+        """
+        if not self.locations:
+            return None
+
+        pos = index * LOCATION_WIDTH
+        lineno, col_offset, end_lineno, end_col_offset = self.locations[
+            pos : pos + LOCATION_WIDTH
+        ]
+        if lineno == -1:
+            return None
+
+        return Location(
+            lineno,
+            col_offset,
+            None if end_lineno == -1 else end_lineno,
+            None if end_col_offset == -1 else end_col_offset,
+        )
+
+    def find(self, type: tuple[Type[Node], ...] | Type[Node]) -> Iterator[int]:
+        """
+        Indices of nodes of the given type, without materialising them
+        """
+        codes = {i for i, x in enumerate(self.classes) if issubclass(x, type)}
+        return (i for i, x in enumerate(self.kinds) if x in codes)
+
+    def node(self, index: int) -> Node:
+        """
+        Materialises the subtree rooted at the given index
+        """
+        # parents are listed before their children, so they are made after them
+        order = [index]
+        for x in order:
+            order.extend(self._child_indices(x))
+
+        made = {}
+        for x in reversed(order):
+            made[x] = self._make_node(x, made)
+
+        return made[index]
+
+    def _child_indices(self, index: int) -> list[int]:
+        fields = self.fields
+        pos = self.offsets[index]
+        ret = []
+
+        for spec in self.node_type(index)._field_specs:
+            if spec.seq:
+                if spec.is_node:
+                    ret.extend(self.items[fields[pos] : fields[pos + 1]])
+                pos += 2
+            else:
+                if spec.is_node and fields[pos] != -1:
+                    ret.append(fields[pos])
+                pos += 1
+
+        return ret
+
+    def _make_node(self, index: int, made: dict[int, Node]) -> Node:
+        fields = self.fields
+        items = self.items
+        values = self.values
+
+        cls = self.classes[self.kinds[index]]
+        pos = self.offsets[index]
+        kwargs = {}
+
+        for spec in cls._field_specs:
+            if spec.seq:
+                members = items[fields[pos] : fields[pos + 1]]
+                if spec.is_node:
+                    value = tuple(made[x] for x in members)
+                else:
+                    value = tuple(values[x] for x in members)
+                pos += 2
+            elif spec.is_node:
+                value = None if fields[pos] == -1 else made[fields[pos]]
+                pos += 1
+            else:
+                value = values[fields[pos]]
+                pos += 1
+
+            kwargs[spec.name] = value
+
+        location = self.location(index)
+        if location is not None:
+            kwargs["_location"] = location
+
+        return cls._make(**kwargs)
+
+    def to_bytes(self) -> bytes:
+        return marshal.dumps(
+            (
+                FORMAT_VERSION,
+                tuple(x.__name__ for x in self.classes),
+                self.kinds.tobytes(),
+                self.offsets.tobytes(),
+                self.fields.tobytes(),
+                self.items.tobytes(),
+                self.locations.tobytes(),
+                self.values,
+            )
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CompactTree":
+        version, names, *buffers, values = marshal.loads(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact tree format version {version}")
+
+        kinds, offsets, fields, items, locations = (
+            array(typecode, buffer)
+            for typecode, buffer in zip(
+                [KIND_TYPECODE, *[INDEX_TYPECODE] * 4],
+                buffers,
+            )
+        )
+
+        return cls(
+            classes=tuple(NODES[x] for x in names),
+            kinds=kinds,
+            offsets=offsets,
+            fields=fields,
+            items=items,
+            values=values,
+            locations=locations,
+        )
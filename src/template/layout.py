@@ -0,0 +1,2622 @@
+# Large parts of this module are adapted from black's linegen.py, lines.py,
+# strings.py, numerics.py, brackets.py and _width_table.py, version 26.10.1
+# (https://github.com/psf/black), which is under the MIT license:
+#
+# Copyright (c) 2018 Łukasz Langa
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import ast
+import bisect
+import io
+import keyword
+import re
+import sys
+import tokenize
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from .common import Node
+
+# the output is the same as the one of black 26.10.1 at the same line length,
+# requirements.txt pins black to that version for the checks comparing them
+
+# delimiter priorities, higher ones are split first
+COMPREHENSION_PRIORITY = 20
+COMMA_PRIORITY = 18
+TERNARY_PRIORITY = 16
+LOGIC_PRIORITY = 14
+STRING_PRIORITY = 12
+COMPARATOR_PRIORITY = 10
+MATH_PRIORITIES = {
+    "|": 9,
+    "^": 8,
+    "&": 7,
+    "<<": 6,
+    ">>": 6,
+    "+": 5,
+    "-": 5,
+    "*": 4,
+    "/": 4,
+    "//": 4,
+    "%": 4,
+    "@": 4,
+    "~": 3,
+    "**": 2,
+}
+DOT_PRIORITY = 1
+
+BRACKETS = {"(": ")", "[": "]", "{": "}"}
+CLOSING_BRACKETS = {")": "(", "]": "[", "}": "{"}
+COMPARATORS = {"<", ">", "==", "!=", "<=", ">=", "<>"}
+ASSIGNMENTS = {
+    "=",
+    "+=",
+    "-=",
+    "*=",
+    "@=",
+    "/=",
+    "%=",
+    "&=",
+    "|=",
+    "^=",
+    "<<=",
+    ">>=",
+    "**=",
+    "//=",
+}
+VARARG_ROLES = {"unary", "def_vararg", "call_vararg"}
+# parentheses of arguments, parameters and bases
+CALL_ROLES = {"trailer", "def", "class"}
+# keywords that are part of an expression, a ternary operand does not stop at them
+EXPRESSION_KEYWORDS = {"not", "await", "and", "or", "is", "in", "True", "False", "None"}
+# operators binding looser than ``|``, an annotation with them is not a bare union
+NOT_UNION = COMPARATORS | {"if", "else", "and", "or", "not", "in", "is", "lambda", ":="}
+
+FSTRING_START = getattr(tokenize, "FSTRING_START", None)
+FSTRING_END = getattr(tokenize, "FSTRING_END", None)
+
+
+class CannotSplit(Exception):
+    pass
+
+
+class Leaf:
+    """
+    Token of a logical line, ``role`` tells apart tokens spelled the same way
+    """
+
+    __slots__ = (
+        "type",
+        "value",
+        "prefix",
+        "role",
+        "annotation",
+        "opening_bracket",
+        "bracket_depth",
+        "detached",
+    )
+
+    def __init__(self, type: str, value: str, prefix: str = "", role=None):
+        # operators and brackets are their own type, invisible parentheses
+        # have the type of a parenthesis and an empty value
+        self.type = type
+        self.value = value
+        self.prefix = prefix
+        self.role = role
+        self.annotation = None
+        self.opening_bracket = None
+        self.bracket_depth = 0
+        # added commas and hugged operands, which black makes without a parent
+        self.detached = False
+
+    def clone(self) -> "Leaf":
+        ret = Leaf(self.type, self.value, self.prefix, self.role)
+        ret.annotation = self.annotation
+        ret.opening_bracket = self.opening_bracket
+        ret.bracket_depth = self.bracket_depth
+        return ret
+
+    def __str__(self) -> str:
+        return self.prefix + self.value
+
+
+def added_comma() -> Leaf:
+    ret = Leaf(",", ",")
+    ret.detached = True
+    return ret
+
+
+def ensure_visible(leaf: Leaf) -> None:
+    if leaf.type == "(":
+        leaf.value = "("
+    elif leaf.type == ")":
+        leaf.value = ")"
+
+
+def is_split_after_delimiter(leaf: Leaf) -> int:
+    if leaf.type == ",":
+        return COMMA_PRIORITY
+
+    return 0
+
+
+def is_split_before_delimiter(leaf: Leaf, previous: Optional[Leaf]) -> int:
+    type, role = leaf.type, leaf.role
+    if role in VARARG_ROLES:
+        return 0
+
+    if type == "." and role != "import":
+        if previous is None or previous.type in CLOSING_BRACKETS:
+            return DOT_PRIORITY
+
+        return 0
+
+    if type in MATH_PRIORITIES:
+        return MATH_PRIORITIES[type]
+
+    if type in COMPARATORS:
+        return COMPARATOR_PRIORITY
+
+    if type == "STRING":
+        if previous is not None and previous.type == "STRING":
+            return STRING_PRIORITY
+
+        return 0
+
+    if type != "NAME":
+        return 0
+
+    value = leaf.value
+    if role == "comp":
+        return COMPREHENSION_PRIORITY
+
+    if role == "ternary":
+        return TERNARY_PRIORITY
+
+    if value == "is" or role == "comparison":
+        return COMPARATOR_PRIORITY
+
+    if value == "and" or value == "or":
+        return LOGIC_PRIORITY
+
+    return 0
+
+
+class BracketTracker:
+    __slots__ = (
+        "depth",
+        "bracket_match",
+        "delimiters",
+        "previous",
+        "for_loop_depths",
+        "lambda_argument_depths",
+        "invisible",
+    )
+
+    def __init__(self):
+        self.depth = 0
+        self.bracket_match = {}
+        self.delimiters = {}
+        self.previous = None
+        self.for_loop_depths = []
+        self.lambda_argument_depths = []
+        self.invisible = []
+
+    def mark(self, leaf: Leaf) -> None:
+        type = leaf.type
+        if (
+            self.depth == 0
+            and type in CLOSING_BRACKETS
+            and (0, type) not in self.bracket_match
+        ):
+            return
+
+        # targets of for loops and lambda arguments are one level deeper,
+        # so commas in them are not delimiters
+        if (
+            self.for_loop_depths
+            and self.for_loop_depths[-1] == self.depth
+            and type == "NAME"
+            and leaf.value == "in"
+        ):
+            self.depth -= 1
+            self.for_loop_depths.pop()
+
+        if (
+            self.lambda_argument_depths
+            and self.lambda_argument_depths[-1] == self.depth
+            and type == ":"
+        ):
+            self.depth -= 1
+            self.lambda_argument_depths.pop()
+
+        if type in CLOSING_BRACKETS:
+            self.depth -= 1
+            leaf.opening_bracket = self.bracket_match.pop((self.depth, type))
+            if not leaf.value:
+                self.invisible.append(leaf)
+
+        leaf.bracket_depth = self.depth
+        if self.depth == 0:
+            priority = is_split_before_delimiter(leaf, self.previous)
+            if priority and self.previous is not None:
+                self.delimiters[id(self.previous)] = priority
+            else:
+                priority = is_split_after_delimiter(leaf)
+                if priority:
+                    self.delimiters[id(leaf)] = priority
+
+        if type in BRACKETS:
+            self.bracket_match[self.depth, BRACKETS[type]] = leaf
+            self.depth += 1
+            if not leaf.value:
+                self.invisible.append(leaf)
+
+        self.previous = leaf
+        if type == "NAME":
+            if leaf.value == "lambda":
+                self.depth += 1
+                self.lambda_argument_depths.append(self.depth)
+            elif leaf.value == "for":
+                self.depth += 1
+                self.for_loop_depths.append(self.depth)
+
+    def max_delimiter_priority(self, exclude: Iterable[int] = ()) -> int:
+        return max(v for k, v in self.delimiters.items() if k not in exclude)
+
+    def delimiter_count_with_priority(self, priority: int = 0) -> int:
+        if not self.delimiters:
+            return 0
+
+        priority = priority or self.max_delimiter_priority()
+        return sum(1 for x in self.delimiters.values() if x == priority)
+
+
+class Line:
+    __slots__ = (
+        "depth",
+        "leaves",
+        "inside_brackets",
+        "should_split_rhs",
+        "tracker",
+        "is_docstring",
+        "magic_trailing_comma",
+    )
+
+    def __init__(self, depth: int = 0, inside_brackets: bool = False):
+        self.depth = depth
+        self.leaves = []
+        self.inside_brackets = inside_brackets
+        self.should_split_rhs = False
+        self.tracker = BracketTracker()
+        self.is_docstring = False
+        # closing bracket after a trailing comma which makes the brackets explode
+        self.magic_trailing_comma = None
+
+    def append(self, leaf: Leaf, track: bool = False) -> None:
+        if self.inside_brackets or track:
+            self.tracker.mark(leaf)
+            if self.has_magic_trailing_comma(leaf):
+                self.magic_trailing_comma = leaf
+
+        self.leaves.append(leaf)
+
+    def has_magic_trailing_comma(self, closing: Leaf) -> bool:
+        """
+        Whether a trailing comma comes before ``closing``, one-tuples and
+        subscripts with a single item don't count
+        """
+        if not (
+            closing.type in CLOSING_BRACKETS
+            and self.leaves
+            and self.leaves[-1].type == ","
+        ):
+            return False
+
+        if closing.type == "}":
+            return True
+
+        if closing.type == "]":
+            return not (
+                closing.role == "trailer"
+                and is_one_sequence_between(
+                    closing.opening_bracket, closing, self.leaves, ("[", "]")
+                )
+            )
+
+        if self.is_import:
+            return True
+
+        return not is_one_sequence_between(
+            closing.opening_bracket, closing, self.leaves
+        )
+
+    def _starts_with(self, *values: str) -> bool:
+        leaves = self.leaves
+        if leaves and leaves[0].value == "async" and len(leaves) > 1:
+            return leaves[1].value in values
+
+        return bool(leaves) and leaves[0].value in values
+
+    @property
+    def is_def(self) -> bool:
+        return self._starts_with("def")
+
+    @property
+    def is_stub_def(self) -> bool:
+        return self.is_def and [x.value for x in self.leaves[-2:]] == [":", "..."]
+
+    @property
+    def is_class(self) -> bool:
+        return bool(self.leaves) and self.leaves[0].value == "class"
+
+    @property
+    def is_decorator(self) -> bool:
+        return bool(self.leaves) and self.leaves[0].type == "@"
+
+    @property
+    def opens_block(self) -> bool:
+        return bool(self.leaves) and self.leaves[-1].type == ":"
+
+    @property
+    def is_import(self) -> bool:
+        return bool(self.leaves) and self.leaves[0].value in ("import", "from")
+
+    @property
+    def is_with_stmt(self) -> bool:
+        return self._starts_with("with")
+
+    @property
+    def is_chained_assignment(self) -> bool:
+        return sum(1 for x in self.leaves if x.type == "=") > 1
+
+    def enumerate_with_length(self, is_reversed: bool = False):
+        items = enumerate(self.leaves)
+        if is_reversed:
+            items = reversed(list(items))
+
+        for index, leaf in items:
+            yield index, leaf, len(leaf.prefix) + len(leaf.value)
+
+    def __str__(self) -> str:
+        if not self.leaves:
+            return ""
+
+        first, *rest = self.leaves
+        return "    " * self.depth + first.value + "".join([str(x) for x in rest])
+
+
+def is_one_sequence_between(
+    opening: Leaf,
+    closing: Leaf,
+    leaves: list[Leaf],
+    brackets: tuple[str, str] = ("(", ")"),
+) -> bool:
+    """
+    Whether there is a single item with a trailing comma between the brackets
+    """
+    if (opening.type, closing.type) != brackets:
+        return False
+
+    for index, leaf in enumerate(leaves):
+        if leaf is opening:
+            break
+    else:
+        return False
+
+    # commas of arguments and parameters are never the one of a one-tuple
+    weight = 2 if opening.type == "(" and opening.role in CALL_ROLES else 1
+    depth = closing.bracket_depth + 1
+    commas = 0
+    for leaf in leaves[index + 1 :]:
+        if leaf is closing or commas >= 2:
+            break
+
+        if leaf.bracket_depth == depth and leaf.type == ",":
+            commas += weight
+
+    return commas < 2
+
+
+class RHSResult(NamedTuple):
+    head: Line
+    body: Line
+    tail: Line
+    opening_bracket: Leaf
+    closing_bracket: Leaf
+
+
+# ranges of wide characters of wcwidth 0.2.14 (unicode 17), black measures
+# lines with them and counts all other characters as one column
+WIDE_CHARACTERS = (
+    (0x1100, 0x115F),
+    (0x231A, 0x231B),
+    (0x2329, 0x232A),
+    (0x23E9, 0x23EC),
+    (0x23F0, 0x23F0),
+    (0x23F3, 0x23F3),
+    (0x25FD, 0x25FE),
+    (0x2614, 0x2615),
+    (0x2630, 0x2637),
+    (0x2648, 0x2653),
+    (0x267F, 0x267F),
+    (0x268A, 0x268F),
+    (0x2693, 0x2693),
+    (0x26A1, 0x26A1),
+    (0x26AA, 0x26AB),
+    (0x26BD, 0x26BE),
+    (0x26C4, 0x26C5),
+    (0x26CE, 0x26CE),
+    (0x26D4, 0x26D4),
+    (0x26EA, 0x26EA),
+    (0x26F2, 0x26F3),
+    (0x26F5, 0x26F5),
+    (0x26FA, 0x26FA),
+    (0x26FD, 0x26FD),
+    (0x2705, 0x2705),
+    (0x270A, 0x270B),
+    (0x2728, 0x2728),
+    (0x274C, 0x274C),
+    (0x274E, 0x274E),
+    (0x2753, 0x2755),
+    (0x2757, 0x2757),
+    (0x2795, 0x2797),
+    (0x27B0, 0x27B0),
+    (0x27BF, 0x27BF),
+    (0x2B1B, 0x2B1C),
+    (0x2B50, 0x2B50),
+    (0x2B55, 0x2B55),
+    (0x2E80, 0x2E99),
+    (0x2E9B, 0x2EF3),
+    (0x2F00, 0x2FD5),
+    (0x2FF0, 0x3029),
+    (0x3030, 0x303E),
+    (0x3041, 0x3096),
+    (0x309B, 0x30FF),
+    (0x3105, 0x312F),
+    (0x3131, 0x318E),
+    (0x3190, 0x31E5),
+    (0x31EF, 0x321E),
+    (0x3220, 0x3247),
+    (0x3250, 0xA48C),
+    (0xA490, 0xA4C6),
+    (0xA960, 0xA97C),
+    (0xAC00, 0xD7A3),
+    (0xF900, 0xFAFF),
+    (0xFE10, 0xFE19),
+    (0xFE30, 0xFE52),
+    (0xFE54, 0xFE66),
+    (0xFE68, 0xFE6B),
+    (0xFF01, 0xFF60),
+    (0xFFE0, 0xFFE6),
+    (0x16FE0, 0x16FE3),
+    (0x16FF2, 0x16FF6),
+    (0x17000, 0x18CD5),
+    (0x18CFF, 0x18D1E),
+    (0x18D80, 0x18DF2),
+    (0x1AFF0, 0x1AFF3),
+    (0x1AFF5, 0x1AFFB),
+    (0x1AFFD, 0x1AFFE),
+    (0x1B000, 0x1B122),
+    (0x1B132, 0x1B132),
+    (0x1B150, 0x1B152),
+    (0x1B155, 0x1B155),
+    (0x1B164, 0x1B167),
+    (0x1B170, 0x1B2FB),
+    (0x1D300, 0x1D356),
+    (0x1D360, 0x1D376),
+    (0x1F004, 0x1F004),
+    (0x1F0CF, 0x1F0CF),
+    (0x1F18E, 0x1F18E),
+    (0x1F191, 0x1F19A),
+    (0x1F200, 0x1F202),
+    (0x1F210, 0x1F23B),
+    (0x1F240, 0x1F248),
+    (0x1F250, 0x1F251),
+    (0x1F260, 0x1F265),
+    (0x1F300, 0x1F320),
+    (0x1F32D, 0x1F335),
+    (0x1F337, 0x1F37C),
+    (0x1F37E, 0x1F393),
+    (0x1F3A0, 0x1F3CA),
+    (0x1F3CF, 0x1F3D3),
+    (0x1F3E0, 0x1F3F0),
+    (0x1F3F4, 0x1F3F4),
+    (0x1F3F8, 0x1F3FA),
+    (0x1F400, 0x1F43E),
+    (0x1F440, 0x1F440),
+    (0x1F442, 0x1F4FC),
+    (0x1F4FF, 0x1F53D),
+    (0x1F54B, 0x1F54E),
+    (0x1F550, 0x1F567),
+    (0x1F57A, 0x1F57A),
+    (0x1F595, 0x1F596),
+    (0x1F5A4, 0x1F5A4),
+    (0x1F5FB, 0x1F64F),
+    (0x1F680, 0x1F6C5),
+    (0x1F6CC, 0x1F6CC),
+    (0x1F6D0, 0x1F6D2),
+    (0x1F6D5, 0x1F6D8),
+    (0x1F6DC, 0x1F6DF),
+    (0x1F6EB, 0x1F6EC),
+    (0x1F6F4, 0x1F6FC),
+    (0x1F7E0, 0x1F7EB),
+    (0x1F7F0, 0x1F7F0),
+    (0x1F90C, 0x1F93A),
+    (0x1F93C, 0x1F945),
+    (0x1F947, 0x1F9FF),
+    (0x1FA70, 0x1FA7C),
+    (0x1FA80, 0x1FA8A),
+    (0x1FA8E, 0x1FAC6),
+    (0x1FAC8, 0x1FAC8),
+    (0x1FACD, 0x1FADC),
+    (0x1FADF, 0x1FAEA),
+    (0x1FAEF, 0x1FAF8),
+    (0x20000, 0x2FFFD),
+    (0x30000, 0x3FFFD),
+)
+WIDE_STARTS = [x[0] for x in WIDE_CHARACTERS]
+
+
+def char_width(char: str) -> int:
+    index = bisect.bisect_right(WIDE_STARTS, ord(char)) - 1
+    return 2 if index >= 0 and ord(char) <= WIDE_CHARACTERS[index][1] else 1
+
+
+def str_width(text: str) -> int:
+    if text.isascii():
+        return len(text)
+
+    return sum(map(char_width, text))
+
+
+def ends_operand(leaf: Leaf) -> bool:
+    if leaf.type == "NAME":
+        return not keyword.iskeyword(leaf.value) or leaf.value in (
+            "True",
+            "False",
+            "None",
+        )
+
+    return leaf.type in ("NUMBER", "STRING", "...") or leaf.type in CLOSING_BRACKETS
+
+
+class _Frame:
+    __slots__ = ("bracket", "fors", "lambdas", "comprehension")
+
+    def __init__(self, bracket: Optional[Leaf]):
+        self.bracket = bracket
+        # for loops waiting for their ``in`` and lambdas waiting for their ``:``
+        self.fors = 0
+        self.lambdas = 0
+        self.comprehension = False
+
+
+def analyze(leaves: list[Leaf]) -> tuple[list[int], list[bool]]:
+    """
+    Sets roles of leaves, returns bracket levels and whether leaves are lambda arguments
+    """
+    first = leaves[0].value
+    is_def = first == "def" or (first == "async" and leaves[1].value == "def")
+    is_class = first == "class"
+    is_import = first in ("import", "from")
+    # the subject of a match statement or the pattern of a case, not a call
+    is_soft_keyword = first in ("match", "case") and leaves[-1].type == ":"
+
+    levels = []
+    lambda_arguments = []
+    frames = [_Frame(None)]
+    previous = None
+    for i, leaf in enumerate(leaves):
+        type = leaf.type
+        frame = frames[-1]
+        if type in CLOSING_BRACKETS:
+            frames.pop()
+            leaf.opening_bracket = frame.bracket
+            leaf.role = frame.bracket.role
+            frame = frames[-1]
+
+        levels.append(len(frames) - 1)
+        lambda_arguments.append(frame.lambdas > 0)
+
+        if type in BRACKETS:
+            if (
+                type == "{"
+                or previous is None
+                or not ends_operand(previous)
+                or (i == 1 and is_soft_keyword)
+            ):
+                leaf.role = "atom"
+            elif type == "(" and len(frames) == 1 and (is_def or is_class):
+                leaf.role = "def" if is_def else "class"
+                # only the parameter list or the bases
+                is_def = is_class = False
+            else:
+                leaf.role = "trailer"
+
+            frames.append(_Frame(leaf))
+
+        elif type in ("-", "+", "~", "*", "**", "@"):
+            if previous is None or not ends_operand(previous):
+                bracket = frame.bracket
+                if type not in ("*", "**") or bracket is None:
+                    leaf.role = "unary"
+                elif bracket.role == "def":
+                    leaf.role = "def_vararg"
+                elif bracket.type == "(" and bracket.role in ("trailer", "class"):
+                    leaf.role = "call_vararg"
+                else:
+                    leaf.role = "unary"
+
+        elif type == "/":
+            # the positional only marker
+            if previous is not None and previous.type in (",", "("):
+                leaf.role = "def_vararg"
+
+        elif type == ":":
+            if frame.lambdas:
+                frame.lambdas -= 1
+                leaf.role = "lambda"
+
+        elif type == ".":
+            if is_import:
+                leaf.role = "import"
+
+        elif type == "NAME":
+            value = leaf.value
+            following = leaves[i + 1].value if i + 1 < len(leaves) else None
+            if value == "for":
+                frame.fors += 1
+                if i == 0 or (i == 1 and first == "async"):
+                    pass
+                elif previous.role == "comp":
+                    frame.comprehension = True
+                else:
+                    leaf.role = "comp"
+                    frame.comprehension = True
+
+            elif value == "async":
+                if i > 0 and following == "for":
+                    leaf.role = "comp"
+
+            elif value == "in":
+                if frame.fors:
+                    frame.fors -= 1
+                elif previous.value != "not":
+                    leaf.role = "comparison"
+
+            elif value == "not":
+                if following == "in" and (previous is None or previous.value != "is"):
+                    leaf.role = "comparison"
+
+            elif value == "if":
+                if i == 0 or first == "case":
+                    pass
+                elif frame.comprehension:
+                    leaf.role = "comp"
+                else:
+                    leaf.role = "ternary"
+
+            elif value == "else":
+                if i > 0:
+                    leaf.role = "ternary"
+
+            elif value == "lambda":
+                frame.lambdas += 1
+
+        previous = leaf
+
+    return levels, lambda_arguments
+
+
+def matching_bracket(leaves: list[Leaf], index: int) -> int:
+    opening = leaves[index]
+    return next(
+        i for i in range(index + 1, len(leaves)) if leaves[i].opening_bracket is opening
+    )
+
+
+def power_end(leaves: list[Leaf], index: int) -> int:
+    """
+    Index after the operand of ``**`` starting at ``index``
+    """
+    count = len(leaves)
+    while leaves[index].type in ("-", "+", "~") or leaves[index].value == "await":
+        index += 1
+
+    if leaves[index].type in BRACKETS:
+        index = matching_bracket(leaves, index) + 1
+    elif leaves[index].type == "STRING":
+        while index < count and leaves[index].type == "STRING":
+            index += 1
+    else:
+        index += 1
+
+    while index < count:
+        type = leaves[index].type
+        if type in ("(", "[") and leaves[index].role == "trailer":
+            index = matching_bracket(leaves, index) + 1
+        elif type == ".":
+            index += 2
+        elif type == "**":
+            return power_end(leaves, index + 1)
+        else:
+            break
+
+    return index
+
+
+def parenthesize_operands(leaves: list[Leaf]) -> list[Leaf]:
+    """
+    Adds parentheses black adds around powers after a unary operator
+    and around numbers with attributes, ``-(x**2)`` and ``(1).real``,
+    attributes of bools lose the space ``unparse`` puts before them
+    """
+    count = len(leaves)
+    opens = {}
+    closes = {}
+    for i, leaf in enumerate(leaves):
+        if leaf.type == "NUMBER":
+            value = leaf.value.lower()
+            if (
+                i + 1 < count
+                and leaves[i + 1].type == "."
+                and not value.startswith(("0x", "0b", "0o"))
+                and "j" not in value
+            ):
+                opens[i] = opens.get(i, 0) + 1
+                closes[i + 1] = closes.get(i + 1, 0) + 1
+                leaves[i + 1].prefix = ""
+
+        elif leaf.value in ("True", "False") and i + 1 < count:
+            if leaves[i + 1].type == ".":
+                leaves[i + 1].prefix = ""
+
+        elif leaf.type in ("-", "+", "~") and leaf.role == "unary" and i + 1 < count:
+            # only a power without trailers on its base
+            base = leaves[i + 1]
+            if base.type in BRACKETS:
+                stop = matching_bracket(leaves, i + 1) + 1
+            elif base.type == "STRING":
+                stop = i + 1
+                while stop < count and leaves[stop].type == "STRING":
+                    stop += 1
+            elif base.type in ("NUMBER", "...") or (
+                base.type == "NAME" and ends_operand(base)
+            ):
+                stop = i + 2
+            else:
+                continue
+
+            if stop < count and leaves[stop].type == "**" and leaves[stop].role is None:
+                end = power_end(leaves, stop + 1)
+                opens[i + 1] = opens.get(i + 1, 0) + 1
+                closes[end] = closes.get(end, 0) + 1
+
+    if not opens:
+        return leaves
+
+    ret = []
+    for i in range(count + 1):
+        ret.extend(Leaf(")", ")") for _ in range(closes.get(i, 0)))
+        if i == count:
+            break
+
+        leaf = leaves[i]
+        for _ in range(opens.get(i, 0)):
+            ret.append(Leaf("(", "(", leaf.prefix))
+            leaf.prefix = ""
+
+        ret.append(leaf)
+
+    return ret
+
+
+def hide_single_item_parens(leaves: list[Leaf], levels: list[int]) -> None:
+    """
+    Makes parentheses around the only item of a list or a set display invisible
+    """
+    for i, leaf in enumerate(leaves[:-1]):
+        if leaf.role != "atom" or leaf.type not in ("[", "{"):
+            continue
+
+        if leaves[i + 1].type == "(":
+            stop = matching_bracket(leaves, i + 1) + 1
+            if leaves[stop].opening_bracket is leaf:
+                hide_redundant_parens(leaves, levels, i + 1, stop)
+
+
+def is_complex_subscript(leaves: list[Leaf]) -> bool:
+    """
+    Whether a subscript item has more than names, literals and unary operators,
+    black puts spaces around its slice colons then
+    """
+    for leaf in leaves:
+        type = leaf.type
+        if type in MATH_PRIORITIES:
+            if leaf.role is None or type == "*":
+                return True
+        elif type in COMPARATORS or type in (":=", "."):
+            return True
+        elif type in ("(", "[") and leaf.role == "trailer":
+            return True
+        elif type == "NAME":
+            value = leaf.value
+            if value in ("and", "or", "not", "is", "lambda", "await"):
+                return True
+            if leaf.role in ("comparison", "ternary"):
+                return True
+
+    return False
+
+
+def space_subscripts(
+    leaves: list[Leaf], levels: list[int], lambda_arguments: list[bool]
+) -> None:
+    first = leaves[0].value
+    for i, leaf in enumerate(leaves):
+        if leaf.type != "[" or leaf.role != "trailer":
+            continue
+
+        # type parameters
+        if (i == 2 and first in ("def", "class", "type")) or (
+            i == 3 and first == "async"
+        ):
+            continue
+
+        level = levels[i] + 1
+        stop = matching_bracket(leaves, i)
+        items = [i]
+        items.extend(
+            j
+            for j in range(i + 1, stop)
+            if levels[j] == level and leaves[j].type == "," and not lambda_arguments[j]
+        )
+        items.append(stop)
+        for start, end in zip(items, items[1:]):
+            colons = [
+                j
+                for j in range(start + 1, end)
+                if levels[j] == level
+                and leaves[j].type == ":"
+                and leaves[j].role != "lambda"
+            ]
+            if not colons or not is_complex_subscript(leaves[start + 1 : end]):
+                continue
+
+            for j in colons:
+                if leaves[j - 1].type not in ("[", ":"):
+                    leaves[j].prefix = " "
+                if leaves[j + 1].type not in ("]", ",", ":"):
+                    leaves[j + 1].prefix = " "
+
+
+def optional_parens(
+    leaves: list[Leaf],
+    levels: list[int],
+    lambda_arguments: list[bool],
+    target_version: tuple[int, int],
+) -> list[tuple[int, int, str]]:
+    """
+    Spans of leaves black wraps in invisible parentheses, as (start, stop, role),
+    one-tuples get visible parentheses with the "tuple" role
+    """
+    count = len(leaves)
+    top = [i for i in range(count) if levels[i] == 0 and not lambda_arguments[i]]
+    spans = []
+
+    def add(start: int, stop: int, role: str = "atom"):
+        # parenthesized atoms keep their own parentheses
+        if start < stop and not (
+            leaves[start].type == "("
+            and leaves[stop - 1].opening_bracket is leaves[start]
+        ):
+            commas = [i for i in top if start <= i < stop and leaves[i].type == ","]
+            if role == "atom" and commas == [stop - 1]:
+                role = "tuple"
+            spans.append((start, stop, role))
+
+    def find(value: str, start: int = 0) -> Optional[int]:
+        return next((i for i in top if i >= start and leaves[i].value == value), None)
+
+    offset = 1 if leaves[0].value == "async" and count > 1 else 0
+    first = leaves[offset]
+    statement = first.value if first.type == "NAME" else None
+
+    if statement in ("return", "del"):
+        add(1, count)
+
+    elif statement == "assert":
+        comma = find(",")
+        if comma is None:
+            add(1, count)
+        else:
+            add(1, comma)
+            add(comma + 1, count)
+
+    elif statement in ("if", "elif", "while"):
+        hide_redundant_parens(leaves, levels, 1, count - 1)
+        add(1, count - 1)
+
+    elif statement == "for":
+        start = offset + 1
+        stop = next(
+            i
+            for i in top
+            if i > start and leaves[i].value == "in" and leaves[i].role is None
+        )
+        add(start, stop)
+        add(stop + 1, count - 1)
+
+    elif statement == "with":
+        # multiple context managers are parenthesized for 3.9 and newer
+        start = offset + 1
+        if target_version >= (3, 9) and not (
+            leaves[start].type == "("
+            and leaves[count - 2].opening_bracket is leaves[start]
+        ):
+            spans.append((start, count - 1, "atom"))
+        elif target_version < (3, 9):
+            # otherwise only context managers which are a single leaf are
+            items = [start - 1]
+            items.extend(i for i in top if leaves[i].type == ",")
+            items.append(count - 1)
+            for i, stop in zip(items, items[1:]):
+                if stop - i == 2:
+                    spans.append((i + 1, stop, "atom"))
+
+    elif statement == "case" and leaves[-1].type == ":" and count > 2:
+        guard = find("if")
+        add(1, count - 1 if guard is None else guard)
+        if guard is not None:
+            hide_redundant_parens(leaves, levels, guard + 1, count - 1)
+            add(guard + 1, count - 1)
+
+    elif statement == "except":
+        if leaves[1].type != "*":
+            stop = find("as")
+            add(1, count - 1 if stop is None else stop)
+
+    elif statement == "from":
+        start = find("import") + 1
+        if leaves[start].type != "*":
+            add(start, count, "import")
+
+    elif statement == "def":
+        for i in param_annotations(leaves, levels, lambda_arguments):
+            add(*i)
+
+        arrow = find("->")
+        if arrow is not None:
+            for leaf in leaves[arrow + 1 : count - 1]:
+                leaf.annotation = "return"
+
+            add(arrow + 1, count - 1)
+
+    elif statement is None or not keyword.iskeyword(statement):
+        # assignments and expression statements
+        points = [i for i in top if leaves[i].type in ASSIGNMENTS]
+        colon = next((i for i in top if leaves[i].type == ":"), None)
+        if colon is not None:
+            points = sorted([colon, *points])
+
+        if points:
+            if any(leaves[i].type == "," for i in top if i < points[0]):
+                add(0, points[0])
+
+            for point, stop in zip(points, [*points[1:], count]):
+                if stop - point > 2 and leaves[point + 2].value == "yield":
+                    hide_redundant_parens(leaves, levels, point + 1, stop)
+                add(point + 1, stop)
+
+        elif is_arithmetic(leaves, top):
+            add(0, count)
+
+    elif statement in ("await", "not", "lambda", "True", "False", "None"):
+        if is_arithmetic(leaves, top):
+            add(0, count)
+
+    statement_spans = {(x[0], x[1]) for x in spans}
+    spans.extend(
+        x
+        for x in ternaries(leaves, levels, lambda_arguments)
+        if (x[0], x[1]) not in statement_spans
+    )
+    return spans
+
+
+def hide_redundant_parens(
+    leaves: list[Leaf], levels: list[int], start: int, stop: int
+) -> None:
+    """
+    Makes parentheses around the whole span invisible, unless they make a tuple,
+    a generator or a yield outside of an assignment
+    """
+    opening = leaves[start]
+    if opening.type != "(" or leaves[stop - 1].opening_bracket is not opening:
+        return
+
+    inner = [
+        leaves[i] for i in range(start + 1, stop - 1) if levels[i] == levels[start] + 1
+    ]
+    if not inner or any(x.type == "," or x.role == "comp" for x in inner):
+        return
+
+    if inner[0].value == "yield" and leaves[start - 1].type not in ASSIGNMENTS:
+        return
+
+    opening.value = ""
+    leaves[stop - 1].value = ""
+
+
+def is_arithmetic(leaves: list[Leaf], top: list[int]) -> bool:
+    priorities = []
+    for i in top:
+        leaf = leaves[i]
+        if leaf.type in COMPARATORS or leaf.type in (",", "|", ":="):
+            return False
+        if leaf.type == "NAME" and leaf.value in NOT_UNION:
+            return False
+        if leaf.type in MATH_PRIORITIES and leaf.role is None:
+            priorities.append(MATH_PRIORITIES[leaf.type])
+
+    return bool(priorities) and max(priorities) in (5, 6, 7, 8)
+
+
+def param_annotations(
+    leaves: list[Leaf], levels: list[int], lambda_arguments: list[bool]
+) -> Iterator[tuple[int, int]]:
+    opening = next(x for x in leaves if x.role == "def")
+    start = leaves.index(opening) + 1
+    stop = next(
+        i for i in range(start, len(leaves)) if leaves[i].opening_bracket is opening
+    )
+
+    def find(value: str, start: int, stop: int) -> Optional[int]:
+        return next(
+            (
+                i
+                for i in range(start, stop)
+                if levels[i] == 1
+                and not lambda_arguments[i]
+                and leaves[i].type == value
+            ),
+            None,
+        )
+
+    while start < stop:
+        end = find(",", start, stop)
+        end = stop if end is None else end
+        colon = find(":", start, end)
+        if colon is not None:
+            ann_stop = find("=", colon, end)
+            if ann_stop is None:
+                ann_stop = end
+            else:
+                # defaults of annotated parameters are spaced
+                leaves[ann_stop].prefix = leaves[ann_stop + 1].prefix = " "
+            ann_start = colon + 1
+            for leaf in leaves[ann_start:ann_stop]:
+                leaf.annotation = "param"
+
+            # unions and displays, black leaves other annotations as they are
+            first = leaves[ann_start]
+            if first.type in ("[", "{"):
+                if leaves[ann_stop - 1].opening_bracket is first:
+                    yield ann_start, ann_stop
+            else:
+                values = {
+                    leaves[i].value
+                    for i in range(ann_start, ann_stop)
+                    if levels[i] == 1
+                }
+                if "|" in values and not values & NOT_UNION:
+                    yield ann_start, ann_stop
+
+        start = end + 1
+
+
+def ternaries(
+    leaves: list[Leaf], levels: list[int], lambda_arguments: list[bool]
+) -> Iterator[tuple[int, int, str]]:
+    count = len(leaves)
+    for i, leaf in enumerate(leaves):
+        if leaf.role != "ternary" or leaf.value != "if":
+            continue
+
+        level = levels[i]
+        start = i
+        while start > 0:
+            x = leaves[start - 1]
+            if levels[start - 1] < level:
+                break
+            if levels[start - 1] == level:
+                if x.type in (",", ":", ":=", "->") or x.type in ASSIGNMENTS:
+                    break
+                if x.role in ("def_vararg", "call_vararg") or (
+                    x.role == "unary" and x.type in ("*", "**", "@")
+                ):
+                    break
+                if x.type == "NAME" and keyword.iskeyword(x.value):
+                    if x.value not in EXPRESSION_KEYWORDS or (
+                        x.value == "in" and x.role is None
+                    ):
+                        break
+            start -= 1
+
+        stop = next(
+            j
+            for j in range(i + 1, count)
+            if levels[j] == level and leaves[j].role == "ternary"
+        )
+        while stop < count:
+            x = leaves[stop]
+            if levels[stop] < level:
+                break
+            if levels[stop] == level and not lambda_arguments[stop]:
+                if x.type in (",", "=", ":=") or (x.type == ":" and x.role is None):
+                    break
+                if x.role == "comp" or x.value in ("as", "from"):
+                    break
+            stop += 1
+
+        # already parenthesized, as the only argument of a call for example
+        if (
+            start > 0
+            and stop < count
+            and leaves[start - 1].type == "("
+            and leaves[stop].opening_bracket is leaves[start - 1]
+        ):
+            continue
+
+        yield start, stop, "atom"
+
+
+def insert_parens(leaves: list[Leaf], spans: list[tuple[int, int, str]]) -> list[Leaf]:
+    opens = {}
+    closes = {}
+    for span in spans:
+        opens.setdefault(span[0], []).append(span)
+        closes.setdefault(span[1], []).append(span)
+
+    ret = []
+    openings = {}
+    for i in range(len(leaves) + 1):
+        # inner spans close first and outer spans open first
+        for span in sorted(closes.get(i, ()), key=lambda x: -x[0]):
+            opening = openings[span]
+            closing = Leaf(")", opening.value and ")", role=opening.role)
+            closing.opening_bracket = opening
+            ret.append(closing)
+
+        if i == len(leaves):
+            break
+
+        leaf = leaves[i]
+        for span in sorted(opens.get(i, ()), key=lambda x: -x[1]):
+            if span[2] == "tuple":
+                opening = Leaf("(", "(", leaf.prefix, "atom")
+            else:
+                opening = Leaf("(", "", leaf.prefix, span[2])
+            openings[span] = opening
+            leaf.prefix = ""
+            ret.append(opening)
+
+        ret.append(leaf)
+
+    return ret
+
+
+def get_leaves_inside_matching_brackets(leaves: list[Leaf]) -> set[int]:
+    start = next((i for i, x in enumerate(leaves) if x.type in BRACKETS), None)
+    if start is None:
+        return set()
+
+    ids = set()
+    stack = []
+    for leaf in leaves[start:]:
+        if leaf.type in BRACKETS:
+            stack.append((BRACKETS[leaf.type], [id(leaf)]))
+        elif leaf.type in CLOSING_BRACKETS:
+            if stack and leaf.type == stack[-1][0]:
+                level_ids = stack.pop()[1]
+                level_ids.append(id(leaf))
+                ids.update(level_ids)
+            else:
+                break
+        elif stack:
+            stack[-1][1].append(id(leaf))
+
+    return ids
+
+
+def can_be_split(line: Line) -> bool:
+    leaves = line.leaves
+    if len(leaves) < 2:
+        return False
+
+    if leaves[0].type == "STRING" and leaves[1].type == ".":
+        call_count = 0
+        dot_count = 0
+        following = leaves[-1]
+        for leaf in leaves[-2::-1]:
+            if leaf.type in BRACKETS:
+                if following.type not in CLOSING_BRACKETS:
+                    return False
+                call_count += 1
+            elif leaf.type == ".":
+                dot_count += 1
+            elif leaf.type == "NAME":
+                if not (following.type == "." or following.type in BRACKETS):
+                    return False
+            elif leaf.type not in CLOSING_BRACKETS:
+                return False
+
+            if dot_count > 1 and call_count > 1:
+                return False
+
+            following = leaf
+
+    return True
+
+
+def is_simple_power_operand(leaves: list[Leaf], index: int, kind: int) -> bool:
+    """
+    Whether the operand of ``**`` is a name or a number, with a unary operator
+    or as a simple lookup, ``kind`` is -1 for the base and 1 for the exponent
+    """
+    start = leaves[index]
+    if start.type in ("NAME", "NUMBER"):
+        return is_simple_lookup(leaves, index, kind)
+
+    if start.type in ("+", "-", "~"):
+        if leaves[index + 1].type in ("NAME", "NUMBER"):
+            return is_simple_lookup(leaves, index + 1, 1)
+
+    return False
+
+
+def is_simple_lookup(leaves: list[Leaf], index: int, kind: int) -> bool:
+    if kind == 1:
+        for leaf in leaves[index:]:
+            if leaf.type in ("(", "["):
+                return False
+            if leaf.type not in ("NAME", ".") or leaf.value == "for":
+                return True
+
+        return True
+
+    contains_brackets = False
+    chain = []
+    while index >= 0:
+        leaf = leaves[index]
+        chain.append(leaf)
+        if leaf.type in (")", "]"):
+            contains_brackets = True
+        if not is_expression_chained(chain):
+            return not contains_brackets
+        index -= 1
+
+    return True
+
+
+def is_expression_chained(chain: list[Leaf]) -> bool:
+    if len(chain) < 2:
+        return True
+
+    current = chain[-1].type
+    past = chain[-2].type
+    if past == "NAME":
+        return current == "."
+    if past in (")", "]"):
+        return current in (")", "]")
+    if past in ("(", "["):
+        return current in ("NAME", "(", "[")
+
+    return False
+
+
+class Layout:
+    """
+    Splits logical lines longer than ``line_length`` like black does
+    """
+
+    def __init__(self, line_length: int, target_version: tuple[int, int]):
+        self.line_length = line_length
+        self.target_version = target_version
+        # black adds commas after ``*args`` and ``**kwargs`` only for
+        # sources which can't run on versions before 3.6 anyway
+        self.trailing_commas = target_version >= (3, 6)
+
+    def fits(self, line: Line, line_length: Optional[int] = None) -> bool:
+        return str_width(str(line)) <= (line_length or self.line_length)
+
+    def format_line(self, leaves: list[Leaf], depth: int) -> str:
+        levels, lambda_arguments = analyze(leaves)
+        parenthesized = parenthesize_operands(leaves)
+        if parenthesized is not leaves:
+            leaves = parenthesized
+            levels, lambda_arguments = analyze(leaves)
+
+        hide_single_item_parens(leaves, levels)
+        space_subscripts(leaves, levels, lambda_arguments)
+        spans = optional_parens(leaves, levels, lambda_arguments, self.target_version)
+        line = Line(depth)
+        for leaf in insert_parens(leaves, spans):
+            line.append(leaf, track=True)
+
+        if self.fits(line):
+            return "\n".join([str(x) for x in self.transform_line(line)])
+
+        leaves = line.leaves
+        state = [(x.prefix, x.value) for x in leaves]
+        lines = list(self.transform_line(line))
+        # black formats its output once more, where the commas it added are
+        # magic trailing commas, they come right before a closing bracket
+        commas = set()
+        index = 0
+        for x in lines:
+            for leaf in x.leaves:
+                if leaf.detached and leaf.type == ",":
+                    commas.add(index)
+                else:
+                    index += 1
+
+        if commas:
+            for leaf, (prefix, value) in zip(leaves, state):
+                leaf.prefix = prefix
+                leaf.value = value
+
+            line = Line(depth)
+            for index, leaf in enumerate(leaves):
+                if index in commas:
+                    comma = Leaf(",", ",")
+                    comma.annotation = leaf.annotation
+                    line.append(comma, track=True)
+
+                line.append(leaf, track=True)
+
+            lines = self.transform_line(line)
+
+        return "\n".join([str(x) for x in lines])
+
+    def transform_line(self, line: Line, force: bool = False) -> Iterator[Line]:
+        line_str = str(line)
+        # whether the line fits is decided with hugged powers
+        hugged_str = line_str
+        if any(x.type == "**" for x in line.leaves):
+            hugged_str = str(next(self.hug_power_op(line, force)))
+
+        if (
+            not line.should_split_rhs
+            and not line.magic_trailing_comma
+            and str_width(hugged_str) <= self.line_length
+        ):
+            transformers = []
+        elif line.is_def and not self.should_split_funcdef_with_rhs(line):
+            transformers = [self.left_hand_split]
+        elif line.inside_brackets:
+            transformers = [self.delimiter_split, self.right_hand_split_with_omits]
+        else:
+            transformers = [self.right_hand_split_with_omits]
+
+        transformers.append(self.hug_power_op)
+
+        for transform in transformers:
+            try:
+                result = self.run_transformer(line, transform, force, line_str)
+            except CannotSplit:
+                continue
+
+            yield from result
+            return
+
+        yield line
+
+    def run_transformer(
+        self, line: Line, transform, force: bool, line_str: str
+    ) -> list[Line]:
+        optional_parens = [x for x in line.tracker.invisible if x.bracket_depth == 0]
+        # splits reset the whitespace before leaves starting lines
+        prefixes = [x.prefix for x in line.leaves]
+        result = []
+        for transformed in transform(line, force):
+            if str(transformed) == line_str:
+                raise CannotSplit("Line transformer returned an unchanged result")
+
+            result.extend(self.transform_line(transformed, force))
+
+        if (
+            force
+            or transform != self.right_hand_split_with_omits
+            or not line.tracker.invisible
+            or any(x.value for x in optional_parens)
+            or self.fits(result[0])
+            or any(x.detached for x in line.leaves)
+        ):
+            return result
+
+        # second opinion, splitting at the optional parentheses right away
+        line_copy = Line(line.depth, line.inside_brackets)
+        line_copy.should_split_rhs = line.should_split_rhs
+        for leaf, prefix in zip(line.leaves, prefixes):
+            leaf = leaf.clone()
+            leaf.prefix = prefix
+            line_copy.append(leaf, track=True)
+
+        second_opinion = self.run_transformer(line_copy, transform, True, line_str)
+        if all(self.fits(x) for x in second_opinion):
+            result = second_opinion
+
+        return result
+
+    def hug_power_op(self, line: Line, force: bool) -> Iterator[Line]:
+        """
+        Removes spaces around ``**`` with simple operands
+        """
+        leaves = line.leaves
+        if not any(x.type == "**" for x in leaves):
+            raise CannotSplit("No doublestar token was found in the line")
+
+        result = Line(line.depth, line.inside_brackets)
+        result.should_split_rhs = line.should_split_rhs
+        result.magic_trailing_comma = line.magic_trailing_comma
+        should_hug = False
+        for index, leaf in enumerate(leaves):
+            hug_this_leaf = should_hug
+            should_hug = (
+                0 < index < len(leaves) - 1
+                and leaf.type == "**"
+                and is_simple_power_operand(leaves, index - 1, -1)
+                and leaves[index - 1].value != "lambda"
+                and is_simple_power_operand(leaves, index + 1, 1)
+            )
+            if hug_this_leaf or should_hug:
+                leaf = leaf.clone()
+                leaf.prefix = ""
+                leaf.detached = True
+
+            result.append(leaf)
+
+        yield result
+
+    def should_split_funcdef_with_rhs(self, line: Line) -> bool:
+        # string return annotations too long for a line split with rhs first
+        return_type = []
+        in_return_type = False
+        for leaf in line.leaves:
+            if leaf.type == ":":
+                in_return_type = False
+            if in_return_type:
+                return_type.append(leaf)
+            if leaf.type == "->":
+                in_return_type = True
+
+        result = Line(line.depth)
+        tracked = get_leaves_inside_matching_brackets(return_type)
+        for leaf in return_type:
+            result.append(leaf, id(leaf) in tracked)
+
+        if result.magic_trailing_comma is not None:
+            return True
+
+        first = next((x for x in return_type if x.value), None)
+        return first is not None and first.type == "STRING" and not self.fits(result)
+
+    def bracket_split_build_line(
+        self, leaves: list[Leaf], original: Line, opening_bracket: Leaf, component: str
+    ) -> Line:
+        result = Line(original.depth)
+        if component == "body":
+            result.inside_brackets = True
+            result.depth += 1
+            if self.ensure_trailing_comma(leaves, original, opening_bracket):
+                if leaves[-1].type != ",":
+                    leaves.append(added_comma())
+
+        tracked = set()
+        if component == "head":
+            tracked = get_leaves_inside_matching_brackets(leaves)
+
+        for leaf in leaves:
+            result.append(leaf, id(leaf) in tracked)
+
+        if component == "body" and self.should_split_line(result, opening_bracket):
+            result.should_split_rhs = True
+
+        return result
+
+    @staticmethod
+    def ensure_trailing_comma(
+        leaves: list[Leaf], original: Line, opening_bracket: Leaf
+    ) -> bool:
+        if not leaves:
+            return False
+
+        if original.is_import:
+            return True
+
+        if not original.is_def or opening_bracket.value != "(":
+            return False
+
+        if any(x.type == "," and x.annotation is None for x in leaves):
+            return False
+
+        return leaves[0].annotation != "return"
+
+    @staticmethod
+    def should_split_line(line: Line, opening_bracket: Leaf) -> bool:
+        """
+        Whether the body of brackets is exploded one item per line right away
+        """
+        if opening_bracket.value not in "[{(":
+            return False
+
+        exclude = set()
+        trailing_comma = False
+        try:
+            last_leaf = line.leaves[-1]
+            if last_leaf.type == ",":
+                trailing_comma = True
+                exclude.add(id(last_leaf))
+            max_priority = line.tracker.max_delimiter_priority(exclude)
+        except (IndexError, ValueError):
+            return False
+
+        return max_priority == COMMA_PRIORITY and (
+            trailing_comma or opening_bracket.role in ("atom", "import")
+        )
+
+    @staticmethod
+    def bracket_split_succeeded_or_raise(head: Line, body: Line, tail: Line) -> None:
+        tail_len = len(str(tail).strip())
+        if not body.leaves:
+            if tail_len == 0:
+                raise CannotSplit("Splitting brackets produced the same line")
+
+            if tail_len < 3:
+                raise CannotSplit("Splitting brackets on an empty body is not worth it")
+
+    def left_hand_split(self, line: Line, force: bool) -> Iterator[Line]:
+        for leaf_type in ("(", "["):
+            tail_leaves = []
+            body_leaves = []
+            head_leaves = []
+            current_leaves = head_leaves
+            matching_bracket = None
+            depth = 0
+            for index, leaf in enumerate(line.leaves):
+                # type parameters come before the parameters
+                if index == 2 and leaf.type == "[":
+                    depth += 1
+                elif depth > 0:
+                    if leaf.type == "[":
+                        depth += 1
+                    elif leaf.type == "]":
+                        depth -= 1
+
+                if (
+                    current_leaves is body_leaves
+                    and leaf.type in CLOSING_BRACKETS
+                    and leaf.opening_bracket is matching_bracket
+                    and matching_bracket is not None
+                    and not (leaf_type == "(" and depth > 0)
+                ):
+                    ensure_visible(leaf)
+                    ensure_visible(matching_bracket)
+                    current_leaves = tail_leaves if body_leaves else head_leaves
+
+                current_leaves.append(leaf)
+                if current_leaves is head_leaves:
+                    if leaf.type == leaf_type and not (leaf_type == "(" and depth > 0):
+                        matching_bracket = leaf
+                        current_leaves = body_leaves
+
+            if matching_bracket and tail_leaves:
+                break
+
+        if not matching_bracket or not tail_leaves:
+            raise CannotSplit("No brackets found")
+
+        head = self.bracket_split_build_line(
+            head_leaves, line, matching_bracket, "head"
+        )
+        body = self.bracket_split_build_line(
+            body_leaves, line, matching_bracket, "body"
+        )
+        tail = self.bracket_split_build_line(
+            tail_leaves, line, matching_bracket, "tail"
+        )
+        self.bracket_split_succeeded_or_raise(head, body, tail)
+        for result in (head, body, tail):
+            if result.leaves:
+                yield result
+
+    def right_hand_split_with_omits(self, line: Line, force: bool) -> Iterator[Line]:
+        first_lines = None
+
+        prefix_lengths = {}
+        length = 4 * line.depth
+        for leaf in line.leaves:
+            prefix_lengths[id(leaf)] = length
+            length += len(leaf.prefix) + len(leaf.value)
+
+        for omit in self.generate_trailers_to_omit(line):
+            if omit:
+                target_opening = None
+                for leaf in reversed(line.leaves):
+                    if leaf.type in CLOSING_BRACKETS and id(leaf) not in omit:
+                        target_opening = leaf.opening_bracket
+                        break
+
+                # the head would be too long anyway
+                if (
+                    target_opening is not None
+                    and target_opening.value
+                    and prefix_lengths.get(id(target_opening), 0) > self.line_length
+                ):
+                    continue
+
+            lines = list(self.right_hand_split(line, force, omit))
+            if first_lines is None and not omit:
+                first_lines = lines
+
+            if self.fits(lines[0]):
+                yield from lines
+                return
+
+        # all splits failed, best effort split with no omits
+        if first_lines is not None:
+            yield from first_lines
+        else:
+            yield from self.right_hand_split(line, force)
+
+    def generate_trailers_to_omit(self, line: Line) -> Iterator[set[int]]:
+        """
+        Cumulative sets of closing brackets to glue to the tail instead of splitting at
+        """
+        omit = set()
+        if not line.magic_trailing_comma:
+            yield omit
+
+        length = 4 * line.depth
+        opening_bracket = None
+        closing_bracket = None
+        inner_brackets = set()
+        for index, leaf, leaf_length in line.enumerate_with_length(is_reversed=True):
+            length += leaf_length
+            if length > self.line_length:
+                break
+
+            previous = line.leaves[index - 1] if index > 0 else None
+            if opening_bracket:
+                if leaf is opening_bracket:
+                    opening_bracket = None
+                elif leaf.type in CLOSING_BRACKETS:
+                    # never omit brackets with trailing commas, they explode
+                    if self.has_trailing_comma(line, leaf, previous):
+                        break
+
+                    inner_brackets.add(id(leaf))
+
+            elif leaf.type in CLOSING_BRACKETS:
+                if previous and previous.type in BRACKETS:
+                    inner_brackets.add(id(leaf))
+                    continue
+
+                if closing_bracket:
+                    omit.add(id(closing_bracket))
+                    omit.update(inner_brackets)
+                    inner_brackets.clear()
+                    yield omit
+
+                if self.has_trailing_comma(line, leaf, previous):
+                    break
+
+                if leaf.value:
+                    opening_bracket = leaf.opening_bracket
+                    closing_bracket = leaf
+
+    @staticmethod
+    def has_trailing_comma(line: Line, closing: Leaf, previous: Optional[Leaf]) -> bool:
+        return (
+            previous is not None
+            and previous.type == ","
+            and not is_one_sequence_between(
+                closing.opening_bracket, closing, line.leaves
+            )
+        )
+
+    def right_hand_split(
+        self, line: Line, force: bool, omit: Iterable[int] = ()
+    ) -> Iterator[Line]:
+        rhs = self.first_right_hand_split(line, omit)
+        yield from self.maybe_split_omitting_optional_parens(rhs, line, force, omit)
+
+    def first_right_hand_split(self, line: Line, omit: Iterable[int] = ()) -> RHSResult:
+        tail_leaves = []
+        body_leaves = []
+        head_leaves = []
+        current_leaves = tail_leaves
+        opening_bracket = None
+        closing_bracket = None
+        for leaf in reversed(line.leaves):
+            if current_leaves is body_leaves:
+                if leaf is opening_bracket:
+                    current_leaves = head_leaves if body_leaves else tail_leaves
+
+            current_leaves.append(leaf)
+            if current_leaves is tail_leaves:
+                if leaf.type in CLOSING_BRACKETS and id(leaf) not in omit:
+                    opening_bracket = leaf.opening_bracket
+                    closing_bracket = leaf
+                    current_leaves = body_leaves
+
+        if not (opening_bracket and closing_bracket and head_leaves):
+            raise CannotSplit("No brackets found")
+
+        tail_leaves.reverse()
+        body_leaves.reverse()
+        head_leaves.reverse()
+        head = self.bracket_split_build_line(head_leaves, line, opening_bracket, "head")
+        body = self.bracket_split_build_line(body_leaves, line, opening_bracket, "body")
+        tail = self.bracket_split_build_line(tail_leaves, line, opening_bracket, "tail")
+        self.bracket_split_succeeded_or_raise(head, body, tail)
+        return RHSResult(head, body, tail, opening_bracket, closing_bracket)
+
+    def maybe_split_omitting_optional_parens(
+        self, rhs: RHSResult, line: Line, force: bool, omit: Iterable[int] = ()
+    ) -> Iterator[Line]:
+        if (
+            not force
+            and rhs.opening_bracket.type == "("
+            and not rhs.opening_bracket.value
+            and rhs.closing_bracket.type == ")"
+            and not rhs.closing_bracket.value
+            and not line.is_import
+            and self.can_omit_invisible_parens(rhs)
+        ):
+            omit = {id(rhs.closing_bracket), *omit}
+            try:
+                # the split omitting optional parentheses
+                rhs_oop = self.first_right_hand_split(line, omit)
+                if self.prefer_split_rhs_oop_over_rhs(rhs_oop, rhs):
+                    yield from self.maybe_split_omitting_optional_parens(
+                        rhs_oop, line, force, omit
+                    )
+                    return
+
+            except CannotSplit as e:
+                if line.is_chained_assignment:
+                    pass
+
+                elif not can_be_split(rhs.body) and not self.fits(rhs.body):
+                    raise CannotSplit(
+                        "Splitting failed, body is still too long and can't be split."
+                    ) from e
+
+        ensure_visible(rhs.opening_bracket)
+        ensure_visible(rhs.closing_bracket)
+        for result in (rhs.head, rhs.body, rhs.tail):
+            if result.leaves:
+                yield result
+
+    def prefer_split_rhs_oop_over_rhs(self, rhs_oop: RHSResult, rhs: RHSResult) -> bool:
+        head = rhs.head.leaves
+        # the split is right after `=`
+        if not (len(head) >= 2 and head[-2].type == "="):
+            return True
+
+        # the left side of assignment contains brackets
+        if not any(x.type in BRACKETS or x.type in CLOSING_BRACKETS for x in head[:-1]):
+            return True
+
+        # the left side of assignment is short enough
+        if not self.fits(rhs.head, self.line_length - 1):
+            return True
+
+        # the left side of assignment explodes anyway
+        if rhs.head.magic_trailing_comma is not None:
+            return True
+
+        # multiple targets stay on the first line
+        rhs_head_equal_count = sum(1 for x in head if x.type == "=")
+        rhs_oop_head_equal_count = sum(1 for x in rhs_oop.head.leaves if x.type == "=")
+        if rhs_head_equal_count > 1 and rhs_head_equal_count > rhs_oop_head_equal_count:
+            return False
+
+        has_closing_bracket_after_assign = False
+        for leaf in reversed(rhs_oop.head.leaves):
+            if leaf.type == "=":
+                break
+            if leaf.type in CLOSING_BRACKETS:
+                has_closing_bracket_after_assign = True
+                break
+
+        return has_closing_bracket_after_assign or (
+            any(x.type == "=" for x in rhs_oop.head.leaves) and self.fits(rhs_oop.head)
+        )
+
+    def can_omit_invisible_parens(self, rhs: RHSResult) -> bool:
+        line = rhs.body
+        tracker = line.tracker
+        if not tracker.delimiters:
+            return True
+
+        max_priority = tracker.max_delimiter_priority()
+        delimiter_count = tracker.delimiter_count_with_priority(max_priority)
+        if delimiter_count > 1:
+            return False
+
+        if delimiter_count == 1:
+            if max_priority == COMMA_PRIORITY and rhs.head.is_with_stmt:
+                return False
+
+        if max_priority == DOT_PRIORITY:
+            return True
+
+        first = line.leaves[0]
+        second = line.leaves[1]
+        if first.type in BRACKETS and second.type not in CLOSING_BRACKETS:
+            if self.can_omit_opening_paren(line, first):
+                return True
+
+        penultimate = line.leaves[-2]
+        last = line.leaves[-1]
+        if last.type in (")", "}") or (last.type == "]" and last.role != "trailer"):
+            if penultimate.type in BRACKETS:
+                return False
+
+            if self.can_omit_closing_paren(line, last):
+                return True
+
+        return False
+
+    def can_omit_opening_paren(self, line: Line, first: Leaf) -> bool:
+        remainder = False
+        length = 4 * line.depth
+        index = -1
+        for index, leaf, leaf_length in line.enumerate_with_length():
+            if leaf.type in CLOSING_BRACKETS and leaf.opening_bracket is first:
+                remainder = True
+            if remainder:
+                length += leaf_length
+                if length > self.line_length:
+                    break
+
+                if leaf.type in BRACKETS:
+                    remainder = False
+
+        else:
+            if len(line.leaves) == index + 1:
+                return True
+
+        return False
+
+    def can_omit_closing_paren(self, line: Line, last: Leaf) -> bool:
+        length = 4 * line.depth
+        seen_other_brackets = False
+        for index, leaf, leaf_length in line.enumerate_with_length():
+            length += leaf_length
+            if leaf is last.opening_bracket:
+                if seen_other_brackets or length <= self.line_length:
+                    return True
+
+            elif leaf.type in BRACKETS:
+                seen_other_brackets = True
+
+        return False
+
+    def can_add_trailing_comma(self, leaf: Leaf) -> bool:
+        if leaf.role in ("def_vararg", "call_vararg"):
+            return self.trailing_commas
+
+        return True
+
+    def delimiter_split(self, line: Line, force: bool) -> Iterator[Line]:
+        last_leaf = line.leaves[-1]
+        tracker = line.tracker
+        try:
+            delimiter_priority = tracker.max_delimiter_priority(exclude={id(last_leaf)})
+        except ValueError:
+            raise CannotSplit("No delimiters found") from None
+
+        if (
+            delimiter_priority == DOT_PRIORITY
+            and tracker.delimiter_count_with_priority(delimiter_priority) == 1
+        ):
+            raise CannotSplit("Splitting a single attribute from its owner looks wrong")
+
+        current_line = Line(line.depth, line.inside_brackets)
+        lowest_depth = sys.maxsize
+        trailing_comma_safe = True
+        for leaf in line.leaves:
+            current_line.append(leaf)
+
+            lowest_depth = min(lowest_depth, leaf.bracket_depth)
+            if trailing_comma_safe and leaf.bracket_depth == lowest_depth:
+                trailing_comma_safe = self.can_add_trailing_comma(leaf)
+
+            if tracker.delimiters.get(id(leaf)) == delimiter_priority:
+                current_line.leaves[0].prefix = ""
+                yield current_line
+
+                current_line = Line(line.depth, line.inside_brackets)
+
+        if current_line.leaves:
+            if (
+                trailing_comma_safe
+                and delimiter_priority == COMMA_PRIORITY
+                and current_line.leaves[-1].type != ","
+            ):
+                current_line.append(added_comma())
+
+            current_line.leaves[0].prefix = ""
+            yield current_line
+
+
+STYLES = ("black",)
+STRING_PREFIX_CHARS = "fturbFTURB"
+UNICODE_ESCAPE_RE = re.compile(
+    r"(?P<backslashes>\\+)(?P<body>"
+    r"(u(?P<u>[a-fA-F0-9]{4}))"
+    r"|(U(?P<U>[a-fA-F0-9]{8}))"
+    r"|(x(?P<x>[a-fA-F0-9]{2}))"
+    r"|(N\{(?P<N>[a-zA-Z0-9 \-]{2,})\})"
+    r")?"
+)
+FSTRING_FIELD_RE = re.compile(r"(?:(?<!\{)|^)\{([^{].*?)\}(?:(?!\})|$)")
+LINE_BREAK_RE = re.compile(r"\r\n|[\r\n]")
+TRIPLE_QUOTES = ('"""', "'''")
+
+
+def _quote_patterns(quote: str) -> tuple[re.Pattern, re.Pattern]:
+    # an unescaped and an escaped quote
+    return (
+        re.compile(rf"(([^\\]|^)(\\\\)*){quote}"),
+        re.compile(rf"([^\\]|^)\\((?:\\\\)*){quote}"),
+    )
+
+
+QUOTE_PATTERNS = {x: _quote_patterns(x) for x in ("'", '"', *TRIPLE_QUOTES)}
+
+
+def get_string_prefix(value: str) -> str:
+    return value[: len(value) - len(value.lstrip(STRING_PREFIX_CHARS))]
+
+
+def normalize_string_prefix(value: str) -> str:
+    prefix = get_string_prefix(value)
+    new_prefix = (
+        prefix.replace("F", "f").replace("B", "b").replace("U", "").replace("u", "")
+    )
+    # there are at most two prefix characters and one of them is "r"
+    if len(new_prefix) == 2 and new_prefix[0].lower() != "r":
+        new_prefix = new_prefix[::-1]
+
+    return new_prefix + value[len(prefix) :]
+
+
+def _sub_twice(pattern: re.Pattern, replacement: str, value: str) -> str:
+    # matches can overlap
+    return pattern.sub(replacement, pattern.sub(replacement, value))
+
+
+def _ends_with_unescaped_quote(body: str) -> bool:
+    if body[-1:] != '"':
+        return False
+
+    preceding = body[:-1]
+    return (len(preceding) - len(preceding.rstrip("\\"))) % 2 == 0
+
+
+def normalize_string_quotes(value: str) -> str:
+    """
+    Prefers double quotes unless they need more escaping
+    """
+    body = value.lstrip(STRING_PREFIX_CHARS)
+    if body[:3] == '"""':
+        return value
+
+    if body[:3] == "'''":
+        orig_quote = "'''"
+        new_quote = '"""'
+    elif body[0] == '"':
+        orig_quote = '"'
+        new_quote = "'"
+    else:
+        orig_quote = "'"
+        new_quote = '"'
+
+    first_quote_pos = value.find(orig_quote)
+    prefix = value[:first_quote_pos]
+    unescaped_new_quote, escaped_new_quote = QUOTE_PATTERNS[new_quote]
+    escaped_orig_quote = QUOTE_PATTERNS[orig_quote][1]
+    body = value[first_quote_pos + len(orig_quote) : -len(orig_quote)]
+    if "r" in prefix.casefold():
+        if unescaped_new_quote.search(body):
+            return value
+
+        new_body = body
+    else:
+        # without unnecessary escapes
+        new_body = _sub_twice(escaped_new_quote, rf"\1\2{new_quote}", body)
+        if body != new_body:
+            body = new_body
+            value = f"{prefix}{orig_quote}{body}{orig_quote}"
+        new_body = _sub_twice(escaped_orig_quote, rf"\1\2{orig_quote}", new_body)
+        new_body = _sub_twice(unescaped_new_quote, rf"\1\\{new_quote}", new_body)
+
+    if "f" in prefix.casefold() or "t" in prefix.casefold():
+        # no backslashes in replacement fields
+        if any("\\" in x for x in FSTRING_FIELD_RE.findall(new_body)):
+            return value
+
+    if new_quote == '"""' and _ends_with_unescaped_quote(new_body):
+        new_body = new_body[:-1] + '\\"'
+
+    orig_escape_count = body.count("\\")
+    new_escape_count = new_body.count("\\")
+    if new_escape_count > orig_escape_count:
+        return value
+
+    if new_escape_count == orig_escape_count and orig_quote == '"':
+        return value
+
+    return f"{prefix}{new_quote}{new_body}{new_quote}"
+
+
+def _lowercase_escape(match: re.Match) -> str:
+    backslashes = match["backslashes"]
+    if match["body"] is None or len(backslashes) % 2 == 0:
+        return match[0]
+
+    if match["u"]:
+        return backslashes + "u" + match["u"].lower()
+    if match["U"]:
+        return backslashes + "U" + match["U"].lower()
+    if match["x"]:
+        return backslashes + "x" + match["x"].lower()
+
+    return backslashes + "N{" + match["N"].upper() + "}"
+
+
+def normalize_unicode_escape_sequences(value: str) -> str:
+    if "\\" not in value or "r" in get_string_prefix(value).lower():
+        return value
+
+    return UNICODE_ESCAPE_RE.sub(_lowercase_escape, value)
+
+
+def normalize_string(value: str) -> str:
+    prefix = get_string_prefix(value)
+    if "\\" in value and set(prefix) & set("fFtT"):
+        # f-strings with backslashes in replacement fields stay as they are
+        body = value[len(prefix) :]
+        quote_len = 3 if body[:3] in TRIPLE_QUOTES else 1
+        fields = FSTRING_FIELD_RE.findall(body[quote_len:-quote_len])
+        if any("\\" in x for x in fields):
+            return value
+
+    value = normalize_unicode_escape_sequences(value)
+    return normalize_string_quotes(normalize_string_prefix(value))
+
+
+def _format_float_or_int(text: str) -> str:
+    if "." not in text:
+        return text
+
+    before, after = text.split(".")
+    return f"{before or 0}.{after or 0}"
+
+
+def normalize_numeric_literal(value: str) -> str:
+    """
+    Lowercases numbers except hexadecimal digits, drops ``+`` from exponents
+    and adds zeros missing around the decimal point
+    """
+    text = value.lower()
+    if text.startswith(("0o", "0b")):
+        return text
+
+    if text.startswith("0x"):
+        return text[:2] + text[2:].upper()
+
+    if "e" in text:
+        before, after = text.split("e")
+        sign = ""
+        if after.startswith("-"):
+            after = after[1:]
+            sign = "-"
+        elif after.startswith("+"):
+            after = after[1:]
+        return f"{_format_float_or_int(before)}e{sign}{after}"
+
+    if text.endswith("j"):
+        return _format_float_or_int(text[:-1]) + "j"
+
+    return _format_float_or_int(text)
+
+
+def fix_multiline_docstring(docstring: str, prefix: str) -> str:
+    lines = []
+    for line in LINE_BREAK_RE.split(docstring):
+        stripped = line.lstrip()
+        if not stripped or stripped == line:
+            lines.append(line)
+        else:
+            # leading tabs are four columns wide like the indentation
+            indent_length = len(line) - len(stripped)
+            lines.append(line[:indent_length].expandtabs(4) + stripped)
+
+    indent = sys.maxsize
+    for line in lines[1:]:
+        stripped = line.lstrip()
+        if stripped:
+            indent = min(indent, len(line) - len(stripped))
+
+    trimmed = [lines[0].strip()]
+    if indent < sys.maxsize:
+        last_line_index = len(lines) - 2
+        for i, line in enumerate(lines[1:]):
+            stripped = line[indent:].rstrip()
+            if stripped or i == last_line_index:
+                trimmed.append(prefix + stripped)
+            else:
+                trimmed.append("")
+
+    return "\n".join(trimmed)
+
+
+def format_docstring(value: str, depth: int, line_length: int) -> str:
+    """
+    Strips a docstring and indents its lines to ``depth``
+    """
+    value = normalize_unicode_escape_sequences(value)
+    # reindenting backslash newline escapes would change the string
+    if re.search(r"\\\s*\n", value):
+        return normalize_string_quotes(normalize_string_prefix(value))
+
+    docstring = normalize_string_quotes(normalize_string_prefix(value))
+    prefix = get_string_prefix(docstring)
+    docstring = docstring[len(prefix) :]
+    quote_char = docstring[0]
+    # not strip(quote_char), """""x""" is '""x'
+    quote_len = 1 if docstring[1] != quote_char else 3
+    docstring = docstring[quote_len:-quote_len]
+    started_empty = not docstring
+    indent = "    " * depth
+
+    if value.lstrip(STRING_PREFIX_CHARS)[:3] in TRIPLE_QUOTES and "\n" in value:
+        docstring = fix_multiline_docstring(docstring, indent)
+    else:
+        docstring = docstring.strip()
+
+    has_trailing_backslash = False
+    if docstring:
+        # quotes and odd backslashes next to the closing quotes get a space
+        if docstring[0] == quote_char:
+            docstring = " " + docstring
+        if docstring[-1] == quote_char:
+            docstring += " "
+        if docstring[-1] == "\\":
+            backslash_count = len(docstring) - len(docstring.rstrip("\\"))
+            if backslash_count % 2:
+                docstring += " "
+                has_trailing_backslash = True
+    elif not started_empty:
+        docstring = " "
+
+    quote = quote_char * quote_len
+    ret = prefix + quote + docstring + quote
+    if quote_len == 3:
+        # closing quotes which don't fit go on their own line,
+        # unless the docstring is one line
+        lines = docstring.splitlines()
+        last_line_length = (
+            len(lines[-1]) if docstring and not docstring.endswith("\n") else 0
+        )
+        if (
+            len(lines) > 1
+            and last_line_length + quote_len > line_length
+            and len(indent) + quote_len <= line_length
+            and not has_trailing_backslash
+            and value[-1 - quote_len] != "\n"
+        ):
+            ret = prefix + quote + docstring + "\n" + indent + quote
+
+    return normalize_string_quotes(normalize_string_prefix(ret))
+
+
+def logical_lines(source: str) -> Iterator[tuple[list[tokenize.TokenInfo], int, int]]:
+    """
+    Yields tokens of logical lines with their depth and the blank lines before them
+    """
+    tokens = []
+    depth = 0
+    before = 0
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        type = token.type
+        if type == tokenize.INDENT:
+            depth += 1
+        elif type == tokenize.DEDENT:
+            depth -= 1
+        elif type in (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER):
+            # lines with only a comment end with NL too
+            if tokens:
+                yield tokens, depth, before
+                tokens = []
+                before = 0
+            elif type == tokenize.NL:
+                before += 1
+        else:
+            tokens.append(token)
+
+
+def make_leaves(
+    tokens: list[tokenize.TokenInfo], source: str, offsets: list[int]
+) -> list[Leaf]:
+    """
+    Leaves of a logical line, ``offsets`` are where the rows of the source start
+    """
+
+    def offset(position: tuple[int, int]) -> int:
+        return offsets[position[0] - 1] + position[1]
+
+    leaves = []
+    end = offset(tokens[0].start)
+    # f-strings are single tokens before 3.12, nested f-strings are kept as one leaf
+    fstring_depth = 0
+    fstring_start = 0
+    for token in tokens:
+        if token.type == FSTRING_START:
+            if not fstring_depth:
+                fstring_start = offset(token.start)
+            fstring_depth += 1
+            continue
+
+        if fstring_depth:
+            if token.type == FSTRING_END:
+                fstring_depth -= 1
+                if not fstring_depth:
+                    stop = offset(token.end)
+                    value = source[fstring_start:stop]
+                    leaves.append(Leaf("STRING", value, source[end:fstring_start]))
+                    end = stop
+            continue
+
+        if token.type == tokenize.OP:
+            type = token.string
+        else:
+            type = tokenize.tok_name[token.type]
+
+        start = offset(token.start)
+        leaves.append(Leaf(type, token.string, source[end:start]))
+        end = offset(token.end)
+
+    leaves[0].prefix = ""
+    return leaves
+
+
+def is_stub_suite(
+    line: Line, lines: list[tuple[list[tokenize.TokenInfo], int, int]], index: int
+) -> bool:
+    """
+    Whether the body of a def or a class at ``index`` is only ``...``
+    """
+    if not (line.opens_block and (line.is_def or line.is_class)):
+        return False
+
+    if index == len(lines):
+        return False
+
+    tokens, depth, _ = lines[index]
+    if depth != line.depth + 1 or len(tokens) != 1 or tokens[0].string != "...":
+        return False
+
+    return index + 1 == len(lines) or lines[index + 1][1] <= line.depth
+
+
+class EmptyLineTracker:
+    """
+    Blank lines before and after logical lines, following black's rules for .py files
+    """
+
+    def __init__(self):
+        self.previous_line = None
+        self.previous_after = 0
+        self.previous_defs = []
+        self.previous_is_module_docstring = False
+
+    def maybe_empty_lines(self, line: Line, before: int) -> tuple[int, int]:
+        """
+        Returns blank lines before and after the line, ``before`` are the blank lines
+        before it in the source
+        """
+        is_first = self.previous_line is None
+        before, after = self._maybe_empty_lines(line, before)
+        before = max(0, before - self.previous_after)
+        if self.previous_is_module_docstring and not (line.is_class or line.is_def):
+            before = 1
+
+        self.previous_is_module_docstring = (
+            is_first and line.is_docstring and line.depth == 0
+        )
+        self.previous_line = line
+        self.previous_after = after
+        return before, after
+
+    def _maybe_empty_lines(self, line: Line, before: int) -> tuple[int, int]:
+        depth = line.depth
+        before = min(before, 1 if depth else 2)
+        user_had_newline = bool(before)
+
+        previous_def = None
+        while self.previous_defs and self.previous_defs[-1].depth >= depth:
+            previous_def = self.previous_defs.pop()
+        if line.is_def or line.is_class:
+            self.previous_defs.append(line)
+
+        previous = self.previous_line
+        if previous is None:
+            return 0, 0
+
+        if line.is_docstring:
+            if previous.is_class:
+                return 0, 1
+            if previous.opens_block and previous.is_def:
+                return 0, 0
+
+        if previous_def is not None:
+            if depth:
+                before = 1
+            elif (
+                previous_def.depth
+                and line.leaves[-1].type == ":"
+                and line.leaves[0].value
+                not in ("with", "try", "for", "while", "if", "match")
+            ):
+                # else, except and the like after a nested def
+                before = 1
+            else:
+                before = 2
+
+        if line.is_decorator or line.is_def or line.is_class:
+            if previous.is_decorator:
+                return 0, 0
+
+            if previous.depth < depth and (previous.is_class or previous.is_def):
+                return (1 if user_had_newline else 0), 0
+
+            if previous.is_stub_def and not user_had_newline:
+                return 0, 0
+
+            return (1 if depth else 2), 0
+
+        if previous.is_import and not line.is_import:
+            if depth == 0 and previous.depth == 0:
+                return 1, 0
+            if depth == previous.depth:
+                return (before or 1), 0
+
+        return before, 0
+
+
+class Formatter:
+    """
+    Formats ``unparse`` output the way black formats it, consecutive chunks
+    of a module are formatted the same as the whole source
+    """
+
+    def __init__(
+        self,
+        line_length: int,
+        target_version: tuple[int, int] = (3, 3),
+        style: str = "black",
+    ):
+        if style not in STYLES:
+            raise ValueError(f"Unsupported style {style!r}")
+
+        self.line_length = line_length
+        self.layout = Layout(line_length, target_version)
+        self.empty_lines = EmptyLineTracker()
+        # blank lines after the previous line, dropped at the end of the source
+        self.after = 0
+
+    def format(self, source: str) -> str:
+        # chunks after the first one start with the end of the previous line
+        if self.empty_lines.previous_line is not None and source.startswith("\n"):
+            source = source[1:]
+
+        offsets = [0]
+        for row in source.split("\n"):
+            offsets.append(offsets[-1] + len(row) + 1)
+
+        lines = list(logical_lines(source))
+        ret = []
+        index = 0
+        while index < len(lines):
+            tokens, depth, before = lines[index]
+            index += 1
+            line = Line(depth)
+            line.leaves = make_leaves(tokens, source, offsets)
+            if is_stub_suite(line, lines, index):
+                line.leaves.append(Leaf("...", "...", " "))
+                index += 1
+
+            ret.append(self.format_line(line, before))
+
+        return "".join(ret)
+
+    def format_line(self, line: Line, before: int) -> str:
+        leaves = line.leaves
+        previous = self.empty_lines.previous_line
+        if (
+            len(leaves) == 1
+            and leaves[0].type == "STRING"
+            and (previous is None or previous.depth < line.depth)
+        ):
+            line.is_docstring = not set(get_string_prefix(leaves[0].value)) & set(
+                "bBfFtT"
+            )
+
+        before, after = self.empty_lines.maybe_empty_lines(line, before)
+        blank_lines = "\n" * (self.after + before)
+        self.after = after
+        if line.is_docstring:
+            docstring = format_docstring(leaves[0].value, line.depth, self.line_length)
+            return f"{blank_lines}{'    ' * line.depth}{docstring}\n"
+
+        for leaf in leaves:
+            if leaf.type == "STRING":
+                leaf.value = normalize_string(leaf.value)
+            elif leaf.type == "NUMBER":
+                leaf.value = normalize_numeric_literal(leaf.value)
+
+        # lines with type comments are not split
+        if leaves[-1].type == "COMMENT":
+            return f"{blank_lines}{line}\n"
+
+        return f"{blank_lines}{self.layout.format_line(leaves, line.depth)}\n"
+
+
+def format_source(
+    source: str,
+    line_length: int,
+    target_version: tuple[int, int] = (3, 3),
+    style: str = "black",
+) -> str:
+    """
+    Formats ``unparse`` output like black formats it, black infers
+    the target versions from the syntax used, which ``target_version`` is the
+    oldest python version for
+    """
+    return Formatter(line_length, target_version, style).format(source)
+
+
+def format_file(path: str, line_length: int = 88) -> None:
+    """
+    Formats a module written by ``unparse`` in place
+    """
+    path = Path(path)
+    source = path.read_text()
+    target_version = minimum_version(ast.parse(source))
+    path.write_text(format_source(source, line_length, target_version))
+
+
+def _walk(node) -> Iterator:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.AST):
+            yield node
+            stack.extend(ast.iter_child_nodes(node))
+            continue
+
+        # untouched lazy subtrees are walked in their source ast,
+        # the class and field names are the same
+        if type(node) is not node.__class__:
+            source = node._builtin_source()
+            if source is not None:
+                stack.append(source)
+                continue
+
+        yield node
+        for spec in node._field_specs:
+            if spec.is_node:
+                value = getattr(node, spec.name)
+                if spec.seq:
+                    stack.extend(value)
+                elif value is not None:
+                    stack.append(value)
+
+
+def _is_simple_decorator(node) -> bool:
+    name = node.__class__.__name__
+    if name == "Call":
+        node = node.func
+        name = node.__class__.__name__
+
+    while name == "Attribute":
+        node = node.value
+        name = node.__class__.__name__
+
+    return name == "Name"
+
+
+def _syntax_versions(node) -> Iterator[tuple[int, int]]:
+    name = node.__class__.__name__
+    if name == "JoinedStr":
+        yield 3, 6
+
+    elif name == "ImportFrom":
+        if node.module == "__future__":
+            if any(alias.name == "annotations" for alias in node.names):
+                yield 3, 7
+
+    elif name == "NamedExpr":
+        yield 3, 8
+
+    elif name == "arguments":
+        if node.posonlyargs:
+            yield 3, 8
+        if node.vararg is not None:
+            if node.vararg.annotation.__class__.__name__ == "Starred":
+                yield 3, 11
+
+    elif name == "Match":
+        yield 3, 10
+
+    elif name == "TryStar":
+        yield 3, 11
+
+    elif name == "Subscript":
+        items = (
+            node.slice.elts
+            if node.slice.__class__.__name__ == "Tuple"
+            else [node.slice]
+        )
+        if any(item.__class__.__name__ == "Starred" for item in items):
+            yield 3, 11
+
+    if name in ("FunctionDef", "AsyncFunctionDef", "ClassDef", "TypeAlias"):
+        type_params = getattr(node, "type_params", None)
+        if type_params or name == "TypeAlias":
+            yield 3, 12
+        if any(
+            getattr(x, "default_value", None) is not None for x in type_params or ()
+        ):
+            yield 3, 13
+        if name != "TypeAlias":
+            if not all(_is_simple_decorator(d) for d in node.decorator_list):
+                yield 3, 9
+
+
+def minimum_version(node: Node) -> tuple[int, int]:
+    """
+    The oldest python version for the syntax of the tree, black infers
+    the versions it targets from the same syntax
+    """
+    ret = (3, 3)
+    for x in _walk(node):
+        for version in _syntax_versions(x):
+            ret = max(ret, version)
+
+    return ret
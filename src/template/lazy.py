@@ -0,0 +1,102 @@
+import ast
+from typing import Any, Type
+
+from .common import Node
+from .nodes import NODES, builtin_location, from_builtin
+
+
+class LazyField:
+    """
+    Descriptor converting a node field of the source ``ast`` node on first access
+    """
+
+    __slots__ = ("name", "slot", "seq")
+
+    def __init__(self, name: str, slot: Any, seq: bool):
+        self.name = name
+        # member descriptor of the regular node class storing the converted value
+        self.slot = slot
+        self.seq = seq
+
+    def is_loaded(self, instance: Node) -> bool:
+        try:
+            self.slot.__get__(instance)
+        except AttributeError:
+            return False
+
+        return True
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        try:
+            return self.slot.__get__(instance, owner)
+        except AttributeError:
+            pass
+
+        value = getattr(instance._source, self.name)
+        if self.seq:
+            value = tuple(lazy_from_builtin(x) for x in value)
+        elif value is not None:
+            value = lazy_from_builtin(value)
+
+        self.slot.__set__(instance, value)
+        return value
+
+
+def mk_lazy_class(cls: Type[Node]) -> Type[Node] | None:
+    lazy_fields = [
+        LazyField(x.name, cls.__dict__[x.name], x.seq)
+        for x in cls._field_specs
+        if x.is_node
+    ]
+
+    if not lazy_fields:
+        return None
+
+    def _builtin_source(self):
+        # nothing was converted, so the source node is still accurate
+        if any(x.is_loaded(self) for x in lazy_fields):
+            return None
+
+        return self._source
+
+    return type(
+        f"Lazy{cls.__name__}",
+        (cls,),
+        {
+            "__slots__": ("_source",),
+            # lazy nodes compare, hash and convert exactly like regular ones,
+            # copy and pickle get a regular node with the same location
+            "__class__": property(lambda self: cls),
+            "_builtin_source": _builtin_source,
+            **{x.name: x for x in lazy_fields},
+        },
+    )
+
+
+LAZY_CLASSES = {x: mk_lazy_class(x) for x in NODES.values()}
+
+
+def lazy_from_builtin(node: ast.AST) -> Node:
+    """
+    Like ``from_builtin``, but node fields are converted on first access
+    """
+    assert isinstance(node, ast.AST)
+    cls = NODES[node.__class__.__name__]
+    lazy_cls = LAZY_CLASSES[cls]
+
+    if lazy_cls is None:
+        return from_builtin(node)
+
+    ret = object.__new__(lazy_cls)
+    object.__setattr__(ret, "_source", node)
+    object.__setattr__(ret, "_location", builtin_location(node))
+
+    for spec in cls._field_specs:
+        if not spec.is_node:
+            value = getattr(node, spec.name)
+            object.__setattr__(ret, spec.name, tuple(value) if spec.seq else value)
+
+    return ret
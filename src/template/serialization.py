@@ -0,0 +1,258 @@
+import marshal
+from array import array
+from typing import Any
+
+from .common import Location, Node, constant_key
+from .nodes import NODES, get_builtin_class
+
+MAGIC = "wast"
+FORMAT_VERSION = 1
+# narrow codes unless some index or location does not fit
+CODE_TYPECODES = ("H", "I")
+
+# opcodes of the node stream, nodes are written children first,
+# so loading pushes field values on a stack and pops them into nodes
+OP_NONE = 0
+# followed by the index in the string table
+OP_STRING = 1
+# followed by the index in the value table
+OP_VALUE = 2
+# followed by the number of items, which are on the stack
+OP_SEQ = 3
+# followed by the number of an earlier node
+OP_REF = 4
+# followed by the four location fields, end positions are stored plus one,
+# so a missing one is zero
+OP_LOCATION = 5
+# plus the index in the class table
+OP_NODE = 6
+
+# the field values of a located class are followed by its location
+_LOCATED = {cls: bool(get_builtin_class(cls)._attributes) for cls in NODES.values()}
+
+
+def _has_locations(node: Node) -> bool:
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.location is not None:
+            return True
+
+        for spec in node._field_specs:
+            if spec.is_node:
+                value = getattr(node, spec.name)
+                if spec.seq:
+                    stack.extend(value)
+                elif value is not None:
+                    stack.append(value)
+
+    return False
+
+
+# entries of the writer stack
+_WRITE, _FINISH, _VALUE, _SEQ = range(4)
+
+
+class _Writer:
+    def __init__(self, structural: bool):
+        self.codes = array(CODE_TYPECODES[-1])
+        self.classes = {}
+        self.strings = {}
+        self.values = {}
+        self.value_list = []
+        # numbers of written nodes, equal trees without locations share one
+        # entry, otherwise only repeated instances are written once
+        self.structural = structural
+        self.written = {}
+        # keeps nodes alive, so their ids are not reused while writing
+        self.instances = []
+
+    def key(self, node: Node) -> Any:
+        return node if self.structural else id(node)
+
+    def add_value(self, value: Any) -> None:
+        codes = self.codes
+        if value is None:
+            codes.append(OP_NONE)
+        elif value.__class__ is str:
+            index = self.strings.setdefault(value, len(self.strings))
+            codes.extend((OP_STRING, index))
+        else:
+            key = constant_key(value)
+            index = self.values.get(key)
+            if index is None:
+                index = self.values[key] = len(self.value_list)
+                self.value_list.append(value)
+            codes.extend((OP_VALUE, index))
+
+    def add_node(self, node: Node) -> None:
+        # explicit stack instead of recursion, so tree depth is not limited by frames
+        codes = self.codes
+        written = self.written
+        stack = [(_WRITE, node)]
+
+        while stack:
+            kind, item = stack.pop()
+            if kind == _VALUE:
+                self.add_value(item)
+            elif kind == _SEQ:
+                codes.extend((OP_SEQ, item))
+            elif kind == _FINISH:
+                self.finish(item)
+            else:
+                number = written.get(self.key(item))
+                if number is not None:
+                    codes.extend((OP_REF, number))
+                    continue
+
+                stack.append((_FINISH, item))
+                todo = []
+                for spec in item._field_specs:
+                    value = getattr(item, spec.name)
+                    if spec.seq:
+                        kind = _WRITE if spec.is_node else _VALUE
+                        todo.extend([(kind, x) for x in value])
+                        todo.append((_SEQ, len(value)))
+                    elif spec.is_node and value is not None:
+                        todo.append((_WRITE, value))
+                    else:
+                        todo.append((_VALUE, value))
+
+                stack.extend(reversed(todo))
+
+    def finish(self, node: Node) -> None:
+        cls = node.__class__
+        codes = self.codes
+        if _LOCATED[cls]:
+            location = node.location
+            if location is None:
+                codes.append(OP_NONE)
+            else:
+                lineno, col_offset, end_lineno, end_col_offset = location
+                codes.extend(
+                    (
+                        OP_LOCATION,
+                        lineno,
+                        col_offset,
+                        0 if end_lineno is None else end_lineno + 1,
+                        0 if end_col_offset is None else end_col_offset + 1,
+                    )
+                )
+
+        index = self.classes.setdefault(cls.__name__, len(self.classes))
+        codes.append(OP_NODE + index)
+
+        # nodes are numbered in the order they are finished, same as when loading
+        self.written[self.key(node)] = len(self.instances)
+        self.instances.append(node)
+
+
+def dumps(node: Node) -> bytes:
+    """
+    Serializes the tree with its source locations
+
+    Repeated subtrees are stored once, for trees with source locations only
+    repeated instances are, since equal subtrees can have different locations
+    """
+    writer = _Writer(structural=not _has_locations(node))
+    writer.add_node(node)
+
+    codes = writer.codes
+    largest = max(codes)
+    typecode = next(x for x in CODE_TYPECODES if largest < 1 << 8 * array(x).itemsize)
+
+    return marshal.dumps(
+        (
+            MAGIC,
+            FORMAT_VERSION,
+            tuple(writer.classes),
+            tuple(writer.strings),
+            tuple(writer.value_list),
+            typecode,
+            array(typecode, codes).tobytes(),
+        )
+    )
+
+
+def loads(data: bytes) -> Node:
+    """
+    Restores a tree saved with ``dumps``, nodes are not validated again
+    """
+    try:
+        magic, version, *tables, typecode, buffer = marshal.loads(data)
+        class_names, strings, values = tables
+    except (ValueError, EOFError, TypeError) as e:
+        raise ValueError("Not a serialized wast tree") from e
+
+    if magic != MAGIC:
+        raise ValueError("Not a serialized wast tree")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported serialization format version {version}")
+
+    classes = []
+    for name in class_names:
+        cls = NODES[name]
+        classes.append((cls._make, len(cls._field_specs), _LOCATED[cls]))
+
+    codes = array(typecode, buffer)
+    it = iter(codes)
+    stack = []
+    push = stack.append
+    nodes = []
+
+    for op in it:
+        if op >= OP_NODE:
+            make, count, located = classes[op - OP_NODE]
+            if located:
+                location = stack.pop()
+                if count:
+                    args = stack[-count:]
+                    del stack[-count:]
+                    node = make(*args, _location=location)
+                else:
+                    node = make(_location=location)
+            elif count:
+                args = stack[-count:]
+                del stack[-count:]
+                node = make(*args)
+            else:
+                node = make()
+
+            nodes.append(node)
+            push(node)
+        elif op == OP_STRING:
+            push(strings[next(it)])
+        elif op == OP_SEQ:
+            count = next(it)
+            if count:
+                items = tuple(stack[-count:])
+                del stack[-count:]
+                push(items)
+            else:
+                push(())
+        elif op == OP_REF:
+            push(nodes[next(it)])
+        elif op == OP_NONE:
+            push(None)
+        elif op == OP_VALUE:
+            push(values[next(it)])
+        elif op == OP_LOCATION:
+            lineno, col_offset, end_lineno, end_col_offset = (
+                next(it),
+                next(it),
+                next(it),
+                next(it),
+            )
+            push(
+                Location(
+                    lineno,
+                    col_offset,
+                    end_lineno - 1 if end_lineno else None,
+                    end_col_offset - 1 if end_col_offset else None,
+                )
+            )
+        else:
+            raise ValueError(f"Unknown opcode {op}")
+
+    (ret,) = stack
+    return ret
@@ -0,0 +1,286 @@
+import ast
+import weakref
+from types import FunctionType
+from typing import Any, Iterator, Optional, TextIO
+
+from . import nodes as w
+from .common import LRUCache, Node
+from .layout import Formatter, format_source, minimum_version
+from .nodes import NODES, from_builtin, to_builtin
+
+# stdlib unparser methods check node types against names in the ast module,
+# here the same names resolve to the wast node classes
+_namespace = {**vars(ast), **NODES}
+
+
+def _rebind(fn: FunctionType) -> FunctionType:
+    ret = FunctionType(
+        fn.__code__, _namespace, fn.__name__, fn.__defaults__, fn.__closure__
+    )
+    ret.__kwdefaults__ = fn.__kwdefaults__
+    ret.__qualname__ = fn.__qualname__
+    return ret
+
+
+# the stdlib unparser is private, when it is missing or works differently
+# trees are converted to ast nodes and unparsed with ast.unparse instead
+_StdlibUnparser = getattr(ast, "_Unparser", object)
+
+# enough for the statements of a large generated module
+UNPARSE_CACHE_SIZE = 2**14
+
+
+class UnparseCache(LRUCache):
+    """
+    Source of unparsed statements, shared between ``unparse`` calls
+    so unchanged subtrees of a regenerated tree are not unparsed again
+
+    Entries are keyed by the identity of the statement and its indentation,
+    hits need the same instances, like statements a regenerated tree keeps
+    from the previous one, hashing and comparing whole subtrees would cost
+    about as much as unparsing them
+    """
+
+    __slots__ = ()
+
+    def __init__(self, maxsize: int = UNPARSE_CACHE_SIZE):
+        super().__init__(maxsize)
+
+
+class Unparser(_StdlibUnparser):
+    """
+    ``ast.unparse`` working directly on wast nodes, without building ``ast`` nodes first
+    """
+
+    def __init__(self, cache: Optional[UnparseCache] = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._visitors = VISITORS
+        self._cache = cache
+        # precedences of the nodes being visited, innermost last
+        self._visiting = []
+
+    # nodes are compared structurally and one instance can appear in several
+    # places, so precedences are keyed by the instance and the depth of the visit
+    # setting them, which is still running when the node is traversed,
+    # nodes set twice by one visit are traversed in the same order
+    def get_precedence(self, node: Node):
+        # only called for the node being visited
+        if self._visiting:
+            return self._visiting[-1]
+
+        return ast._Precedence.TEST
+
+    def set_precedence(self, precedence, *nodes: Node):
+        depth = len(self._visiting)
+        for node in nodes:
+            self._precedences.setdefault((id(node), depth), []).append(precedence)
+
+    def _take_precedence(self, node: Node):
+        key = (id(node), len(self._visiting))
+        queued = self._precedences.get(key)
+        if not queued:
+            return ast._Precedence.TEST
+
+        ret = queued.pop(0)
+        if not queued:
+            del self._precedences[key]
+
+        return ret
+
+    def get_type_comment(self, node: Node):
+        location = node.location
+        lineno = None if location is None else location.lineno
+        comment = self._type_ignores.get(lineno) or node.type_comment
+        if comment is not None:
+            return f" # type: {comment}"
+
+    def traverse(self, node):
+        if isinstance(node, (list, tuple)):
+            for item in node:
+                self.traverse(item)
+            return
+
+        self._visiting.append(self._take_precedence(node))
+        if (
+            self._cache is not None
+            and isinstance(node, w.stmt)
+            # the first statement is not preceded by a newline
+            and self._source
+            # type: ignore comments depend on line numbers, not on the node
+            and not self._type_ignores
+        ):
+            self._traverse_cached(node)
+        else:
+            self._visitors[node.__class__](self, node)
+        self._visiting.pop()
+
+    def _traverse_cached(self, node: Node):
+        key = (id(node), self._indent)
+        entry = self._cache.get(key)
+        # the id of a collected node can be reused by a new one
+        if entry is not None and entry[0]() is node:
+            text = entry[1]
+        else:
+            source = self._source
+            self._source = [""]
+            self._visitors[node.__class__](self, node)
+            text = "".join(self._source)
+            self._cache[key] = (weakref.ref(node), text)
+            self._source = source
+
+        self._source.append(text)
+
+    def visit_arguments(self, node: Node):
+        # sequence fields are tuples, the stdlib version concatenates them to a list
+        super().visit_arguments(_ListFields(node))
+
+
+class _ListFields:
+    __slots__ = ("_node",)
+
+    def __init__(self, node: Node):
+        self._node = node
+
+    def __getattr__(self, name: str):
+        value = getattr(self._node, name)
+        if value.__class__ is tuple:
+            return list(value)
+
+        return value
+
+
+for _name, _value in vars(_StdlibUnparser).items():
+    if _name in vars(Unparser):
+        continue
+
+    # contextmanager wrappers live in contextlib and are left alone
+    if getattr(_value, "__globals__", None) is vars(ast):
+        setattr(Unparser, _name, _rebind(_value))
+
+# type keyed dispatch instead of building method names for every node
+VISITORS = {
+    cls: getattr(Unparser, f"visit_{name}", getattr(Unparser, "generic_visit", None))
+    for name, cls in NODES.items()
+}
+
+_PROBE = """
+\'\'\'docstring\'\'\'
+@decorator(x)
+async def f(a, /, b: int = -1, *c, d=2, **e) -> None:
+    global g
+    return (yield a ** -b if not c else [x async for x in e if x])
+class C(B, metaclass=M):
+    x: int = f'{a!r:>{b}}' + b'c' * (1, 2)[::2]
+    with a as (b, c), d: del e[1:2, ...]
+    try:
+        lambda *a, k=1: (a := k)
+    except E as e:
+        raise X from e
+match x:
+    case [1, *rest] | {'k': _} if x:
+        pass
+"""
+
+
+def _works() -> bool:
+    try:
+        probe = ast.parse(_PROBE)
+        return Unparser().visit(from_builtin(probe)) == ast.unparse(probe)
+    except Exception:
+        return False
+
+
+UNPARSER_WORKS = _works()
+
+
+def unparse(
+    node: Node,
+    line_length: Optional[int] = None,
+    cache: Optional[UnparseCache] = None,
+    style: str = "black",
+) -> str:
+    """
+    Returns the source of the tree, with ``line_length`` it is formatted
+    in ``style`` at that line length, the only style is black's,
+    with ``cache`` unchanged statements reuse their source from earlier calls
+    """
+    ret = None
+    # untouched lazy trees still have their source ast
+    if type(node) is not node.__class__:
+        source = node._builtin_source()
+        if source is not None:
+            ret = ast.unparse(source)
+
+    if ret is None:
+        if UNPARSER_WORKS:
+            ret = Unparser(cache).visit(node)
+        else:
+            ret = ast.unparse(to_builtin(node))
+
+    if line_length is None:
+        return ret
+
+    return format_source(ret, line_length, minimum_version(node), style)
+
+
+def iter_unparse(
+    node: Node,
+    line_length: Optional[int] = None,
+    cache: Optional[UnparseCache] = None,
+    style: str = "black",
+) -> Iterator[str]:
+    """
+    Yields the source of a ``Module`` statement by statement, other nodes
+    and modules which can't be unparsed directly in one chunk
+
+    Joined chunks are the same as ``unparse(node, line_length, cache, style)``
+    """
+    if not isinstance(node, NODES["Module"]) or not UNPARSER_WORKS:
+        yield unparse(node, line_length, cache, style)
+        return
+
+    formatter = None
+    if line_length is not None:
+        # blank lines between statements depend on the ones before them
+        formatter = Formatter(line_length, minimum_version(node), style)
+
+    unparser = Unparser(cache)
+    unparser._type_ignores = {
+        ignore.lineno: f"ignore{ignore.tag}" for ignore in node.type_ignores
+    }
+
+    body = node.body
+    docstring = unparser.get_raw_docstring(node)
+    if docstring is not None:
+        unparser._write_docstring(docstring)
+        chunk = "".join(unparser._source)
+        if formatter is not None:
+            chunk = formatter.format(chunk)
+
+        yield chunk
+        body = body[1:]
+
+    for stmt in body:
+        # a non empty buffer makes statements start on a new line like in unparse
+        unparser._source = [""] if unparser._source else []
+        unparser._precedences.clear()
+        unparser.traverse(stmt)
+        chunk = "".join(unparser._source)
+        if formatter is not None:
+            chunk = formatter.format(chunk)
+
+        yield chunk
+
+
+def unparse_to(
+    node: Node,
+    stream: TextIO,
+    line_length: Optional[int] = None,
+    cache: Optional[UnparseCache] = None,
+    style: str = "black",
+) -> None:
+    """
+    Writes the source to a text stream without keeping all of it in memory
+    """
+    for chunk in iter_unparse(node, line_length, cache, style):
+        stream.write(chunk)
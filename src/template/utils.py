@@ -1,22 +1,100 @@
 import ast
+import builtins
+import importlib
+import os
+import traceback
+import weakref
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from functools import wraps
-from typing import Callable, Type
+from pathlib import Path
+from types import CodeType
+from typing import Callable, Iterable, Iterator, Optional, Type
 
 import attrs
 
-from .common import Node, TransformerContext
+from .cache import ParseCache
+from .common import Node, TransformerContext, constant_key
+from .lazy import lazy_from_builtin
 from .nodes import from_builtin, to_builtin
+from .serialization import dumps, loads
+from .unparser import unparse
 
 
-def unparse(node: Node) -> str:
-    tree = to_builtin(node)
-    tree = ast.fix_missing_locations(tree)
-    return ast.unparse(tree)
+def compile(
+    node: Node, filename: str = "<wast>", mode: str = "exec", optimize: int = -1
+) -> CodeType:
+    """
+    Compiles the tree to a code object without going through the source text,
+    ``mode`` is the same as for the builtin ``compile``
+    """
+    # compile only reads the tree, so lazy subtrees can keep their source nodes
+    tree = to_builtin(node, reuse_sources=True)
+    return builtins.compile(tree, filename, mode, dont_inherit=True, optimize=optimize)
+
+
+def parse(text: str, lazy: bool = False, cache: Optional[ParseCache] = None) -> Node:
+    """
+    Parses the code into a tree, ``lazy=True`` converts
+    child nodes from stdlib ``ast`` only when they are first accessed
+
+    With ``cache`` the same source is only parsed once, lazy trees are not cached
+    """
+    if lazy:
+        return lazy_from_builtin(ast.parse(text))
+
+    if cache is not None:
+        ret = cache.get(text)
+        if ret is None:
+            ret = from_builtin(ast.parse(text))
+            cache.put(text, ret)
+
+        return ret
 
+    return from_builtin(ast.parse(text))
 
-def parse(text: str) -> Node:
-    tree = ast.parse(text)
-    return from_builtin(tree)
+
+# smaller batches are parsed in process, starting workers would take longer
+PARSE_MANY_MIN_BATCH = 16
+
+Source = str | bytes | os.PathLike
+
+
+def _read_source(source: Source) -> bytes:
+    # files are passed to the parser as bytes, it decodes them itself
+    if isinstance(source, bytes):
+        return source
+
+    return Path(source).read_bytes()
+
+
+def _parse_serialized(source: Source) -> bytes:
+    # trees are sent back serialized, pickling nodes is much slower
+    return dumps(from_builtin(ast.parse(_read_source(source))))
+
+
+def parse_many(
+    sources: Iterable[Source], workers: Optional[int] = None, chunksize: int = 1
+) -> Iterator[Node]:
+    """
+    Parses sources in ``workers`` processes, yields trees in the order of ``sources``
+
+    Strings and paths name files, like in ``Transformer.transform_many``,
+    bytes are source code, files are read as bytes
+    so their encoding declarations are respected
+    """
+    sources = list(sources)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(sources) < PARSE_MANY_MIN_BATCH:
+        for source in sources:
+            yield from_builtin(ast.parse(_read_source(source)))
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        for data in pool.map(_parse_serialized, sources, chunksize=chunksize):
+            yield loads(data)
 
 
 NT = Type[Node]
@@ -32,14 +110,39 @@ class Transformer:
     """
 
     funcs: tuple[TransformerFn] = attrs.field(converter=tuple)
+    # positions in funcs of the functions which can select each class,
+    # filled on first use
+    _dispatch: dict[type, tuple[int, ...]] = attrs.field(
+        factory=dict, init=False, eq=False, repr=False
+    )
 
     def __or__(self, other):
         assert isinstance(other, Transformer)
         return Transformer((*self.funcs, *other.funcs))
 
+    def _positions(self, cls: type) -> tuple[int, ...]:
+        ret = self._dispatch.get(cls)
+        if ret is None:
+            ret = self._dispatch[cls] = tuple(
+                i for i, fn in enumerate(self.funcs) if _may_select(fn, cls)
+            )
+
+        return ret
+
     def __call__(self, node, context):
-        for fn in self.funcs:
-            node = fn(node, context)
+        funcs = self.funcs
+        cls = node.__class__
+        positions = self._positions(cls)
+        i = 0
+        while i < len(positions):
+            pos = positions[i]
+            node = funcs[pos](node, context)
+            i += 1
+            if node.__class__ is not cls:
+                # later functions see the new node, same as running all of them
+                cls = node.__class__
+                positions = self._positions(cls)
+                i = bisect_right(positions, pos)
 
         return node
 
@@ -48,6 +151,89 @@ class Transformer:
         ctx = TransformerContext(parents=tuple(), original=node)
         return node._transform(self, ctx)
 
+    def transform_many(
+        self,
+        paths: Iterable[str | os.PathLike],
+        workers: Optional[int] = None,
+        import_path: Optional[str] = None,
+        line_length: Optional[int] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Iterator["TransformResult"]:
+        """
+        Parses, transforms and unparses files in ``workers`` processes,
+        yields results in completion order, errors are captured per file
+
+        Workers import the transformer from ``import_path``,
+        like ``"package.module:name"``, as its functions can't be pickled.
+        ``progress`` is called with the number of finished files and their total
+        """
+        paths = list(paths)
+        total = len(paths)
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if import_path is not None and load_transformer(import_path) != self:
+            raise ValueError(f"{import_path} is a different transformer")
+
+        if workers <= 1 or total < PARSE_MANY_MIN_BATCH:
+            results = (_transform_file(self, x, line_length) for x in paths)
+            for done, result in enumerate(results, 1):
+                if progress is not None:
+                    progress(done, total)
+                yield result
+            return
+
+        if import_path is None:
+            raise ValueError("Worker processes need the import_path of the transformer")
+
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(_transform_file, import_path, x, line_length) for x in paths
+            ]
+            for done, future in enumerate(as_completed(futures), 1):
+                if progress is not None:
+                    progress(done, total)
+                yield future.result()
+
+
+@attrs.frozen
+class TransformResult:
+    """
+    Outcome of ``Transformer.transform_many`` for one file,
+    either its new source or the formatted exception
+    """
+
+    path: str | os.PathLike
+    source: Optional[str] = None
+    error: Optional[str] = None
+
+
+def load_transformer(import_path: str) -> Transformer:
+    """
+    Imports a transformer given like ``"package.module:name"``
+    """
+    module, _, name = import_path.partition(":")
+    ret = getattr(importlib.import_module(module), name)
+    if not isinstance(ret, Transformer):
+        raise TypeError(f"{import_path} is not a Transformer")
+
+    return ret
+
+
+def _transform_file(
+    transformer: Transformer | str, path: str | os.PathLike, line_length: Optional[int]
+) -> TransformResult:
+    try:
+        if isinstance(transformer, str):
+            transformer = load_transformer(transformer)
+
+        tree = from_builtin(ast.parse(Path(path).read_bytes()))
+        source = unparse(transformer.transform(tree), line_length)
+    except Exception:
+        return TransformResult(path, error=traceback.format_exc())
+
+    return TransformResult(path, source=source)
+
 
 @attrs.frozen
 class mk_transformer:
@@ -76,4 +262,65 @@ class mk_transformer:
 
             return f(node, context)
 
+        ret._node_type = self.type
         return Transformer([ret])
+
+
+def _may_select(fn: TransformerFn, cls: type) -> bool:
+    # functions not made by mk_transformer can select anything
+    node_type = getattr(fn, "_node_type", None)
+    return node_type is None or issubclass(cls, node_type)
+
+
+# keys are built from the class, field values and ids of the already interned
+# children, so they don't refer to the node and only the node is held weakly
+_interned: weakref.WeakValueDictionary[tuple, Node] = weakref.WeakValueDictionary()
+
+
+def _intern_key(node: Node) -> tuple:
+    # locations are not part of equality, but equal subtrees
+    # from different places must keep their own
+    ret = [node.__class__, node.location]
+    for spec in node._field_specs:
+        value = getattr(node, spec.name)
+        if spec.is_node:
+            # interned children are alive as long as their parent is
+            if spec.seq:
+                value = tuple(map(id, value))
+            elif value is not None:
+                value = id(value)
+        elif spec.type == "constant":
+            value = constant_key(value)
+
+        ret.append(value)
+
+    return tuple(ret)
+
+
+@mk_transformer()
+def _intern_node(node, context):
+    return _interned.setdefault(_intern_key(node), node)
+
+
+@mk_transformer()
+def _intern_node_without_location(node, context):
+    if node.location is not None:
+        node = node.__class__._make(*(getattr(node, x.name) for x in node._field_specs))
+
+    return _interned.setdefault(_intern_key(node), node)
+
+
+def intern(node: Node, keep_locations: bool = False) -> Node:
+    """
+    Returns the tree with structurally equal subtrees replaced by one shared instance
+
+    Locations are dropped, with ``keep_locations`` they are kept and subtrees
+    are only shared when their locations are the same too, so nothing is shared
+    in parsed trees, where every node has its own location.
+    Shared instances are kept in a process-wide weak table,
+    so they are released as soon as no tree uses them
+    """
+    if keep_locations:
+        return _intern_node.transform(node)
+
+    return _intern_node_without_location.transform(node)
@@ -1,23 +1,71 @@
 from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
 from itertools import chain
 
 import keyword
-from typing import Any, Callable
+import sys
+from typing import Any, Callable, Iterator
 
 from attrs import define, field
 
 from . import nodes as w
 
+_validation_default = True
+_validation_override: ContextVar[bool | None] = ContextVar(
+    "wast_validation", default=None
+)
+
+
+def validation_enabled() -> bool:
+    enabled = _validation_override.get()
+    if enabled is None:
+        return _validation_default
+
+    return enabled
+
+
+def set_validation(enabled: bool) -> None:
+    """
+    Enable or disable node validation for the whole process
+    """
+    global _validation_default
+    _validation_default = enabled
+
+
+@contextmanager
+def validation(enabled: bool) -> Iterator[None]:
+    """
+    Enable or disable node validation inside the ``with`` block
+
+    The setting is stored in a context variable,
+    so other threads and asyncio tasks keep their own setting
+    """
+    token = _validation_override.set(enabled)
+    try:
+        yield
+    finally:
+        _validation_override.reset(token)
+
 
 @define(repr=False)
 class ProxyInstanceOfValidator(object):
     type: Callable[[], Any] = field()
+    _resolved: Any = field(init=False, default=None, eq=False)
 
     def __call__(self, inst, attr, value):
         """
         We use a callable class to be able to change the ``__repr__``.
         """
-        type = self.type()
+        if not validation_enabled():
+            return
+
+        # node classes are forward references, resolve them on first use
+        type = self._resolved
+        if type is None:
+            type = self._resolved = self.type()
+
         if not isinstance(value, type):
             raise TypeError(
                 "'{name}' must be {type!r} (got {value!r} that is a "
@@ -39,21 +87,98 @@ class ProxyInstanceOfValidator(object):
 
 
 @define(repr=False)
-class DeepIterableConverter(object):
-    member_converter: Callable[[Any], Any]  # FIXME
+class SequenceConverter(object):
+    """
+    Flattens, converts and type checks sequence field members in a single pass
+    """
+
+    name: str
+    type: Callable[[], Any]
+    member_converter: Callable[[Any], Any]
+    _resolved: Any = field(init=False, default=None, eq=False)
 
     def __call__(self, value):
         """
         We use a callable class to be able to change the ``__repr__``.
         """
-        return [self.member_converter(x) for x in value]
+        convert = self.member_converter
+        if not validation_enabled():
+            return flatten(value, convert)
+
+        type = self._resolved
+        if type is None:
+            type = self._resolved = self.type()
+
+        # already flat and converted tuples are stored as is
+        if value.__class__ is tuple:
+            for x in value:
+                if isinstance(x, (list, tuple)) or convert(x) is not x:
+                    break
+
+                if not isinstance(x, type):
+                    self.fail(x, type)
+            else:
+                return value
+
+        ret = []
+        for x in value:
+            if isinstance(x, (list, tuple)):
+                members = x
+            else:
+                members = (x,)
+
+            for y in members:
+                y = convert(y)
+                if not isinstance(y, type):
+                    self.fail(y, type)
+
+                ret.append(y)
+
+        return tuple(ret)
+
+    def fail(self, value, type):
+        raise TypeError(
+            "'{name}' members must be {type!r} (got {value!r} that is a "
+            "{actual!r}).".format(
+                name=self.name,
+                type=type,
+                actual=value.__class__,
+                value=value,
+            ),
+            self.name,
+            type,
+            value,
+        )
 
     def __repr__(self):
-        return "<deep_iterable converter using {converter!r}>".format(
-            converter=self.member_converter
+        return "<sequence converter for type {type!r} using {converter!r}>".format(
+            type=self.type(), converter=self.member_converter
         )
 
 
+def flatten(value: Any, convert: Callable[[Any], Any]) -> tuple:
+    """
+    Converts sequence field members without type checks,
+    nested lists and tuples are flattened
+    """
+    # already flat and converted tuples are stored as is
+    if value.__class__ is tuple:
+        for x in value:
+            if isinstance(x, (list, tuple)) or convert(x) is not x:
+                break
+        else:
+            return value
+
+    ret = []
+    for x in value:
+        if isinstance(x, (list, tuple)):
+            ret.extend(map(convert, x))
+        else:
+            ret.append(convert(x))
+
+    return tuple(ret)
+
+
 def unwrap_node(value: w.WrappedNode | w.Node) -> w.Node:
     if isinstance(value, w.WrappedNode):
         return value.__inner__
@@ -67,19 +192,54 @@ def unpack_nested(val):
     )
 
 
+def _identifier(val: str | w.Name) -> str:
+    if val.__class__ is not str:
+        match val:
+            case str():
+                pass
+            case w.Name():
+                val = val.id
+            case other:
+                raise TypeError(
+                    f"{val} has type {val.__class__}. Must be {str} or w.Name"
+                )
+
+    return val
+
+
 def convert_identifier(val: str | w.Name) -> str:
-    match val:
-        case str():
-            pass
-        case w.Name():
-            val = val.id
-        case other:
-            raise TypeError(f"{val} has type {val.__class__}. Must be {str} or w.Name")
+    val = _identifier(val)
+    if validation_enabled():
+        return check_identifier(val)
+
+    return sys.intern(str(val))
+
 
+def intern_identifier(val: str | w.Name) -> str:
+    """
+    ``convert_identifier`` without validation
+    """
+    return sys.intern(str(_identifier(val)))
+
+
+# large enough for all the distinct names of a big codebase
+IDENTIFIER_CACHE_SIZE = 2**18
+
+
+@lru_cache(maxsize=IDENTIFIER_CACHE_SIZE)
+def check_identifier(val: str) -> str:
+    """
+    Validates the identifier and returns its interned copy,
+    results are cached so every name is only checked once
+    """
     if keyword.iskeyword(val):
         raise ValueError(f"{val} is a Python keyword")
 
     if not val.isidentifier() and val != "*":
         raise ValueError(f"{val} is not a valid Python identifier")
 
-    return val
+    return sys.intern(str(val))
+
+
+def unwrap_nodes(val):
+    return tuple(unwrap_node(x) for x in unpack_nested(val))